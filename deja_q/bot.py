@@ -1,16 +1,25 @@
 import os
+import hmac
 import logging
 from flask import Flask, request
 from slackeventsapi import SlackEventAdapter
 from dotenv import load_dotenv
 from deja_q.vector_store import MessageVectorStore
 from deja_q.message_handler import MessageHandler
+from deja_q.slack_client import SlackClient
+from deja_q.reindex import ReindexJob
+from deja_q.dedup import DedupCache, SQLiteDedupStore, event_keys
+from deja_q.profiling import ProfileInProgressError, profile_session, tracer
 
 # Load environment variables
 load_dotenv()
 
 SLACK_SIGNING_SECRET = os.getenv("SLACK_SIGNING_SECRET")
 SLACK_BOT_TOKEN = os.getenv("SLACK_BOT_TOKEN")
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+TRACE_DIR = os.getenv("TRACE_DIR", PROFILE_DIR)
+MAX_PROFILE_SECONDS = 300
 PROTOTYPE_CHANNEL_NAME = 'prototype'
 
 # Configure logging
@@ -20,16 +29,26 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Track processed message IDs to prevent duplicates
-processed_messages = set()
-
 def create_app():
     """Create and configure the Flask app."""
     app = Flask(__name__)
+
+    # With DEJA_Q_TRACE set, keep the slowest traces on disk
+    if tracer.enabled:
+        tracer.start_flushing(TRACE_DIR, interval=float(os.getenv("TRACE_FLUSH_INTERVAL", "60")))
     
-    # Initialize vector store and message handler
-    vector_store = MessageVectorStore(PROTOTYPE_CHANNEL_NAME)
-    message_handler = MessageHandler(vector_store)
+    # Track processed events to prevent duplicates, in SQLite if it should survive restarts
+    dedup_ttl = float(os.getenv("DEDUP_TTL", "3600"))
+    dedup_db_path = os.getenv("DEDUP_DB_PATH")
+    if dedup_db_path:
+        processed_events = SQLiteDedupStore(dedup_db_path, ttl=dedup_ttl)
+    else:
+        processed_events = DedupCache(ttl=dedup_ttl, max_size=int(os.getenv("DEDUP_MAX_SIZE", "10000")))
+
+    # Initialize a shared rate-limited Slack client, the vector store and message handler
+    slack_client = SlackClient(SLACK_BOT_TOKEN, timeout=int(os.getenv("SLACK_TIMEOUT", "10")))
+    vector_store = MessageVectorStore(PROTOTYPE_CHANNEL_NAME, client=slack_client)
+    message_handler = MessageHandler(vector_store, client=slack_client)
 
     # Initialize Slack Events API adapter with retry disabled
     slack_events_adapter = SlackEventAdapter(
@@ -41,6 +60,15 @@ def create_app():
     try:
         vector_store.initialize()
         logger.info("Vector store initialized successfully")
+
+        # Migrate to a new embedding model in the background while serving from the current one
+        reindex_model = os.getenv("REINDEX_EMBEDDING_MODEL")
+        if reindex_model and reindex_model != vector_store.model_name:
+            ReindexJob(
+                vector_store,
+                reindex_model,
+                cpu_budget=float(os.getenv("REINDEX_CPU_BUDGET", "0.25"))
+            ).start()
     except Exception as e:
         logger.error(f"Error initializing vector store: {str(e)}")
         # Continue running even if vector store fails to initialize
@@ -70,22 +98,14 @@ def create_app():
             logger.info("Ignoring message_changed event")
             return "", 200
             
-        # Get unique message identifier
-        client_msg_id = event.get("client_msg_id")
-        message_ts = event.get("ts")
-        message_id = client_msg_id or message_ts
-        
-        # Check if we've already processed this message
-        if message_id in processed_messages:
-            logger.info(f"Message {message_id} already processed - Ignoring")
-            return "", 200
-            
-        # Add to processed messages
-        if message_id:
-            processed_messages.add(message_id)
-            # Prevent set from growing indefinitely (keep last 1000 messages)
-            if len(processed_messages) > 1000:
-                processed_messages.pop()
+        # Check if we've already processed this event or message, and mark it as processed
+        keys = event_keys(event_data)
+        try:
+            if processed_events.check_and_mark(keys):
+                logger.info(f"Event {', '.join(keys)} already processed - Ignoring")
+                return "", 200
+        except Exception as e:
+            logger.error(f"Error checking for duplicate event: {str(e)}")
         
         # Process the message
         message_handler.handle_message(event_data)
@@ -97,9 +117,33 @@ def create_app():
     def health_check():
         return "Slack Bot is running!", 200
 
-    return app
+    @app.route("/admin/profile", methods=["POST"])
+    def start_profile():
+        """Sample stacks and capture request traces for ?seconds=N, then write them to PROFILE_DIR."""
+        # The admin endpoint only exists when ADMIN_TOKEN is configured
+        if not ADMIN_TOKEN:
+            return "Not Found", 404
+        authorization = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(authorization.encode(), f"Bearer {ADMIN_TOKEN}".encode()):
+            return "Unauthorized", 401
+        try:
+            seconds = float(request.args.get("seconds", "30"))
+        except ValueError:
+            return "seconds must be a number", 400
+        if not 0 < seconds <= MAX_PROFILE_SECONDS:
+            return f"seconds must be between 0 and {MAX_PROFILE_SECONDS}", 400
+        
+        try:
+            paths = profile_session(seconds, PROFILE_DIR)
+        except ProfileInProgressError as e:
+            return str(e), 409
+        logger.info(f"Profiling for {seconds}s, output will be written to {PROFILE_DIR}")
+        return paths, 202
 
-app = create_app()
+    return app
 
+# Only build the app when run as a script. Encoder worker processes are spawned and
+# re-import the main module as __mp_main__, which must not start another bot.
 if __name__ == "__main__":
+    app = create_app()
     app.run(port=3000)
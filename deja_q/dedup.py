@@ -0,0 +1,133 @@
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, List
+
+
+def event_keys(event_data: dict) -> List[str]:
+    """All identifiers under which a Slack event may be redelivered.
+
+    Slack retries reuse the event_id, while the same message can also arrive in
+    separate events, so the message's client_msg_id and channel/ts are keys too.
+    """
+    event = event_data.get("event", {})
+    keys = []
+    if event_data.get("event_id"):
+        keys.append(f"event:{event_data['event_id']}")
+    if event.get("client_msg_id"):
+        keys.append(f"msg:{event['client_msg_id']}")
+    if event.get("ts"):
+        keys.append(f"ts:{event.get('channel', '')}:{event['ts']}")
+    return keys
+
+
+class DedupCache:
+    def __init__(self, ttl: float = 3600.0, max_size: int = 10000):
+        """In-memory record of recently seen event keys, bounded by age and size.
+
+        Keys are kept in insertion order, and every key lives for the same ttl, so
+        expired keys are always at the front and each operation is amortized O(1).
+        When the cache is full the oldest key is evicted.
+
+        Args:
+            ttl: Seconds a key is remembered
+            max_size: Maximum number of keys remembered
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self._expires_at: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float) -> None:
+        while self._expires_at:
+            key, expires_at = next(iter(self._expires_at.items()))
+            if expires_at > now and len(self._expires_at) <= self.max_size:
+                break
+            self._expires_at.popitem(last=False)
+
+    def check_and_mark(self, keys: Iterable[str]) -> bool:
+        """Record keys as seen.
+
+        Returns:
+            True if any of the keys was already seen (the event is a duplicate)
+        """
+        keys = list(keys)
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            duplicate = any(key in self._expires_at for key in keys)
+            for key in keys:
+                self._expires_at[key] = now + self.ttl
+                self._expires_at.move_to_end(key)
+            self._expire(now)
+            return duplicate
+
+    def __len__(self) -> int:
+        return len(self._expires_at)
+
+
+class SQLiteDedupStore:
+    def __init__(self, path: str, ttl: float = 3600.0, purge_every: int = 100):
+        """Record of seen event keys in SQLite, shared across restarts and processes.
+
+        Args:
+            path: Path of the SQLite database file
+            ttl: Seconds a key is remembered
+            purge_every: Delete expired keys once every this many checks
+        """
+        self.path = path
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self._checks = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS seen_events (key TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS seen_events_expiry ON seen_events (expires_at)")
+
+    def check_and_mark(self, keys: Iterable[str]) -> bool:
+        """Record keys as seen.
+
+        Returns:
+            True if any of the keys was already seen (the event is a duplicate)
+        """
+        keys = list(keys)
+        if not keys:
+            return False
+        # Wall-clock time, as keys are compared across processes and restarts
+        now = time.time()
+        with self._lock:
+            try:
+                # BEGIN IMMEDIATE takes the write lock, so the check and the insert are
+                # atomic across processes sharing the database
+                self._conn.execute("BEGIN IMMEDIATE")
+                placeholders = ",".join("?" * len(keys))
+                duplicate = self._conn.execute(
+                    f"SELECT 1 FROM seen_events WHERE key IN ({placeholders}) AND expires_at > ? LIMIT 1",
+                    (*keys, now)
+                ).fetchone() is not None
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO seen_events (key, expires_at) VALUES (?, ?)",
+                    [(key, now + self.ttl) for key in keys]
+                )
+                self._checks += 1
+                if self._checks % self.purge_every == 0:
+                    self._conn.execute("DELETE FROM seen_events WHERE expires_at <= ?", (now,))
+                self._conn.execute("COMMIT")
+                return duplicate
+            except Exception as e:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                logging.error(f"Error checking event dedup store: {str(e)}")
+                raise
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM seen_events").fetchone()[0]
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,155 @@
+import logging
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+
+# Model loaded once per worker process when encoding with a process pool
+_worker_model = None
+
+
+def _init_worker(model_name: str) -> None:
+    global _worker_model
+    from sentence_transformers import SentenceTransformer
+    _worker_model = SentenceTransformer(model_name)
+
+
+def _encode_in_worker(texts: List[str]) -> np.ndarray:
+    return _worker_model.encode(
+        texts, batch_size=len(texts), convert_to_numpy=True, show_progress_bar=False
+    )
+
+
+class BulkEncoder:
+    def __init__(self, model, token_budget: int = 16384, max_batch_size: int = 256,
+                 num_workers: int = 0, model_name: Optional[str] = None):
+        """Encode large numbers of texts in length-sorted, memory-bounded batches.
+
+        Texts are sorted by token length so every batch holds texts of similar length and
+        little padding is wasted. Each batch is sized so that batch size times its longest
+        text stays within token_budget, which gives short messages large batches and long
+        ones small batches.
+
+        Args:
+            model: SentenceTransformer used for encoding in this process
+            token_budget: Maximum number of (padded) tokens per batch
+            max_batch_size: Upper bound on texts per batch
+            num_workers: Number of worker processes, 0 encodes in this process
+            model_name: Model to load in worker processes, required when num_workers > 0
+        """
+        if num_workers > 0 and not model_name:
+            raise ValueError("model_name is required to encode with worker processes")
+        self.model = model
+        self.token_budget = token_budget
+        self.max_batch_size = max_batch_size
+        self.num_workers = num_workers
+        self.model_name = model_name
+        self.last_stats: dict = {}
+
+    def token_lengths(self, texts: Sequence[str], chunk_size: int = 10000) -> np.ndarray:
+        """Number of tokens in each text, capped at the model's maximum sequence length."""
+        tokenizer = getattr(self.model, "tokenizer", None)
+        max_length = getattr(self.model, "max_seq_length", None) or 512
+        lengths = np.empty(len(texts), dtype=np.int32)
+        for start in range(0, len(texts), chunk_size):
+            chunk = list(texts[start:start + chunk_size])
+            if tokenizer is not None:
+                ids = tokenizer(chunk, add_special_tokens=True, truncation=True, max_length=max_length)["input_ids"]
+                lengths[start:start + len(chunk)] = [len(x) for x in ids]
+            else:
+                # Rough estimate for models without a tokenizer
+                lengths[start:start + len(chunk)] = [min(max_length, len(t.split()) + 2) for t in chunk]
+        return lengths
+
+    def plan_batches(self, texts: Sequence[str]) -> List[np.ndarray]:
+        """Group text indices into length-sorted batches that fit the token budget.
+
+        Returns:
+            List of index arrays, one per batch
+        """
+        lengths = self.token_lengths(texts)
+        order = np.argsort(lengths, kind="stable")
+        batches = []
+        start = 0
+        while start < len(order):
+            end = start + 1
+            # Texts are sorted by length, so the last one in the batch is the longest
+            while (end < len(order) and end - start < self.max_batch_size and
+                   (end - start + 1) * max(int(lengths[order[end]]), 1) <= self.token_budget):
+                end += 1
+            batches.append(order[start:end])
+            start = end
+        return batches
+
+    def encode(self, texts: Sequence[str]) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Encode texts batch by batch.
+
+        Args:
+            texts: Texts to encode
+
+        Yields:
+            (indices, embeddings) pairs, where indices are positions in texts. Batches are
+            yielded in completion order, not input order.
+        """
+        started = time.perf_counter()
+        batches = self.plan_batches(texts)
+        if self.num_workers > 0:
+            yield from self._encode_with_pool(texts, batches)
+        else:
+            for indices in batches:
+                batch = [texts[i] for i in indices]
+                embeddings = self.model.encode(
+                    batch, batch_size=len(batch), convert_to_numpy=True, show_progress_bar=False
+                )
+                yield indices, embeddings
+
+        elapsed = time.perf_counter() - started
+        self.last_stats = {
+            "messages": len(texts),
+            "batches": len(batches),
+            "seconds": elapsed,
+            "messages_per_second": len(texts) / elapsed if elapsed > 0 else 0.0,
+        }
+        logging.info(
+            f"Encoded {len(texts)} messages in {len(batches)} batches in {elapsed:.2f}s "
+            f"({self.last_stats['messages_per_second']:.1f} messages/s)"
+        )
+
+    def _encode_with_pool(self, texts: Sequence[str], batches: List[np.ndarray]) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        # Keep only a few batches in flight so finished embeddings don't pile up in memory
+        max_in_flight = self.num_workers * 2
+        # Spawn rather than fork: torch and the tokenizers are already loaded in this process
+        # and the bot has threads running, and forking that state can deadlock the workers
+        with ProcessPoolExecutor(max_workers=self.num_workers, initializer=_init_worker,
+                                 initargs=(self.model_name,),
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            pending = {}
+            remaining = iter(batches)
+            while True:
+                for indices in remaining:
+                    future = pool.submit(_encode_in_worker, [texts[i] for i in indices])
+                    pending[future] = indices
+                    if len(pending) >= max_in_flight:
+                        break
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future.result()
+
+    def encode_into(self, texts: Sequence[str], out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Encode texts, writing each finished batch straight into a single output array.
+
+        Args:
+            texts: Texts to encode
+            out: Optional preallocated (len(texts), dim) array to write into
+
+        Returns:
+            Array of embeddings in the same order as texts
+        """
+        for indices, embeddings in self.encode(texts):
+            if out is None:
+                out = np.empty((len(texts), embeddings.shape[1]), dtype=np.float32)
+            out[indices] = embeddings
+        return out
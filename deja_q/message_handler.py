@@ -1,20 +1,67 @@
 import os
+import time
 import logging
-from slack_sdk import WebClient
-from typing import Optional
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Dict, List, Optional, Tuple
 from .vector_store import MessageVectorStore
+from .slack_client import SlackClient
 from .ollama_client import OllamaClient
+from .profiling import tracer
+from .resilience import AdmissionQueue, CircuitBreaker, Deadline, DegradationLevel, Priority, RateLimitTimeout
 
 class MessageHandler:
-    def __init__(self, vector_store: MessageVectorStore):
-        self.client = WebClient(token=os.getenv("SLACK_BOT_TOKEN"))
+    def __init__(self, vector_store: MessageVectorStore, client: Optional[SlackClient] = None):
+        self.slack_timeout = int(os.getenv("SLACK_TIMEOUT", "10"))
+        # Share the vector store's Slack client so both draw on the same rate limits
+        self.client = client or vector_store.client
         self.vector_store = vector_store
         self.similarity_threshold = 0.8
+        self.max_candidates = 5
+
+        # Per-stage deadlines: every admitted message has request_timeout seconds from the
+        # moment it was queued, and Ollama calls are cut off after summary_timeout seconds
+        self.request_timeout = float(os.getenv("REQUEST_TIMEOUT", "30"))
+        self.summary_timeout = float(os.getenv("OLLAMA_TIMEOUT", "20"))
         self.ollama = OllamaClient(
             base_url=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"),
-            model=os.getenv("OLLAMA_MODEL", "mistral")
+            model=os.getenv("OLLAMA_MODEL", "mistral"),
+            timeout=self.summary_timeout,
+            breaker=CircuitBreaker(
+                "ollama",
+                failure_threshold=int(os.getenv("OLLAMA_FAILURE_THRESHOLD", "3")),
+                reset_timeout=float(os.getenv("OLLAMA_RESET_TIMEOUT", "30"))
+            ),
+            summary_cache_size=int(os.getenv("SUMMARY_CACHE_SIZE", "256"))
+        )
+
+        # Multi-candidate summaries: up to max_summaries threads are summarized when their
+        # similarity is within summary_similarity_gap of the best match. summary_mode is
+        # "parallel" (one Ollama request per thread) or "combined" (one request for all).
+        self.max_summaries = int(os.getenv("MAX_SUMMARIES", "1"))
+        self.summary_similarity_gap = float(os.getenv("SUMMARY_SIMILARITY_GAP", "0.05"))
+        self.summary_mode = os.getenv("SUMMARY_MODE", "parallel")
+        self._summary_pool = ThreadPoolExecutor(
+            max_workers=int(os.getenv("SUMMARY_CONCURRENCY", "2")),
+            thread_name_prefix="deja-q-summary"
+        )
+
+        # Bounded admission queue: messages beyond MAX_PENDING_MESSAGES are shed
+        self.admission = AdmissionQueue(
+            self._handle_admitted,
+            max_size=int(os.getenv("MAX_PENDING_MESSAGES", "50")),
+            num_workers=int(os.getenv("WORKER_THREADS", "2"))
         )
 
+        # Questions that were shed, expired in the queue or only acknowledged are indexed
+        # later on the backfill lane, once the queue is below deferred_index_load
+        self.deferred_index_load = float(os.getenv("DEFERRED_INDEX_LOAD", "0.5"))
+        self._deferred: Deque[Tuple[dict, Optional[str]]] = deque()
+        self._deferred_ready = threading.Event()
+        self._deferred_worker: Optional[threading.Thread] = None
+        self._deferred_lock = threading.Lock()
+
     def handle_message(self, event_data: dict) -> None:
         """Handle incoming message events."""
         message = event_data["event"]
@@ -42,23 +89,12 @@ class MessageHandler:
                 not message.get("thread_ts") and   # Not a thread reply
                 message.get("user")):              # Has a real user
             
-            try:
-                # Get channel info
-                channel_info = self.client.conversations_info(channel=message["channel"])
-                channel_name = channel_info["channel"]["name"]
-                
-                # Log channel info
-                logging.info(f"Channel Name: {channel_name}")
-                logging.info(f"Channel ID: {message['channel']}")
-                
-                # Check if this is the prototype channel
-                if channel_name == self.vector_store.channel_name:
-                    logging.info("Processing message in prototype channel")
-                    self._process_message(message, message["channel"])
-                else:
-                    logging.info(f"Ignoring message - not in prototype channel (got {channel_name}, expected {self.vector_store.channel_name})")
-            except Exception as e:
-                logging.error(f"Error handling message: {str(e)}")
+            # Hand the message to a worker so the Slack request returns immediately
+            if self.admission.submit(message):
+                logging.info(f"Queued message for processing ({self.admission.depth()} pending)")
+            else:
+                logging.warning(f"Shed message {message.get('ts')} - too many pending messages")
+                self._defer_indexing(message)
         else:
             # Log why message was ignored
             reasons = []
@@ -77,13 +113,287 @@ class MessageHandler:
         
         logging.info(f"{'='*90}\n")
 
-    def _process_message(self, message: dict, channel_id: str) -> None:
+    def _handle_admitted(self, message: dict, enqueued_at: float) -> None:
+        """Process a message taken off the admission queue."""
+        with tracer.trace("handle_message", ts=message.get("ts"), channel=message.get("channel")):
+            tracer.add_span("queue_wait", time.monotonic() - enqueued_at)
+            deadline = Deadline(self.request_timeout, start=enqueued_at)
+            if deadline.expired():
+                # Don't spend Slack calls on a message nobody is waiting for anymore
+                logging.warning(f"Dropping message {message.get('ts')} - expired after {deadline.elapsed():.1f}s in queue")
+                self._defer_indexing(message)
+                return
+            self._handle_channel_message(message, deadline)
+
+    def _handle_channel_message(self, message: dict, deadline: Deadline) -> None:
+        """Process a message if it was posted in the channel the vector store covers."""
+        try:
+            # Get channel info
+            channel_info = self.client.conversations_info(channel=message["channel"], deadline=deadline)
+            channel_name = channel_info["channel"]["name"]
+            
+            # Log channel info
+            logging.info(f"Channel Name: {channel_name}")
+            logging.info(f"Channel ID: {message['channel']}")
+            
+            # Check if this is the prototype channel
+            if channel_name == self.vector_store.channel_name:
+                logging.info("Processing message in prototype channel")
+                self._process_message(message, message["channel"], deadline)
+            else:
+                logging.info(f"Ignoring message - not in prototype channel (got {channel_name}, expected {self.vector_store.channel_name})")
+        except RateLimitTimeout as e:
+            logging.warning(f"Dropping message {message.get('ts')} - {str(e)} for conversations_info")
+            self._defer_indexing(message)
+        except Exception as e:
+            logging.error(f"Error handling message: {str(e)}")
+
+    def _defer_indexing(self, message: dict, channel_id: Optional[str] = None) -> None:
+        """Index a message later, channel_id is None if its channel has not been checked yet."""
+        logging.info(f"Deferring indexing of message {message.get('ts')}")
+        self._deferred.append((message, channel_id))
+        with self._deferred_lock:
+            if self._deferred_worker is None:
+                self._deferred_worker = threading.Thread(
+                    target=self._index_deferred_loop, name="deja-q-deferred-index", daemon=True
+                )
+                self._deferred_worker.start()
+        self._deferred_ready.set()
+
+    def index_deferred(self) -> int:
+        """Index deferred messages on the backfill lane for as long as the load stays low.
+
+        Returns:
+            Number of messages added to the vector store
+        """
+        indexed = 0
+        channel_names: Dict[str, str] = {}
+        while self._deferred and self.admission.load() < self.deferred_index_load:
+            message, channel_id = self._deferred.popleft()
+            try:
+                if channel_id is None:
+                    if message["channel"] not in channel_names:
+                        channel_info = self.client.conversations_info(
+                            channel=message["channel"],
+                            priority=Priority.BACKFILL
+                        )
+                        channel_names[message["channel"]] = channel_info["channel"]["name"]
+                    if channel_names[message["channel"]] != self.vector_store.channel_name:
+                        continue
+                    channel_id = message["channel"]
+                self.vector_store.add_message(message, channel_id, priority=Priority.BACKFILL)
+                indexed += 1
+            except Exception as e:
+                logging.error(f"Error indexing deferred message: {str(e)}")
+                # Keep the message and retry on the next pass
+                self._deferred.append((message, channel_id))
+                break
+        if indexed:
+            logging.info(f"Indexed {indexed} deferred messages, {len(self._deferred)} left")
+        return indexed
+
+    def _index_deferred_loop(self) -> None:
+        while True:
+            # Wake up on new deferred messages, and every second to check whether load has dropped
+            self._deferred_ready.wait(timeout=1.0)
+            self._deferred_ready.clear()
+            if self._deferred:
+                self.index_deferred()
+
+    def _degradation_level(self, deadline: Deadline) -> DegradationLevel:
+        """Pick how much of the pipeline to run based on queue pressure and time left."""
+        load = self.admission.load()
+        if deadline.expired() or load >= 0.9:
+            return DegradationLevel.ACK_ONLY
+        if load >= 0.75:
+            return DegradationLevel.NO_THREAD
+        if load >= 0.5 or self.ollama.breaker.state == self.ollama.breaker.OPEN:
+            return DegradationLevel.NO_SUMMARY
+        return DegradationLevel.FULL
+
+    def _fetch_thread(self, channel_id: str, thread_ts: str, deadline: Deadline) -> List[str]:
+        """Fetch a thread, or return no messages if the rate limits would hold it past the deadline."""
+        try:
+            return self.vector_store.get_thread_messages(channel_id, thread_ts, deadline=deadline)
+        except RateLimitTimeout as e:
+            logging.warning(f"Skipping thread fetch: {str(e)}")
+            return []
+
+    def _summarize(self, thread_messages: list[str], thread_ts: str, deadline: Deadline) -> Optional[str]:
+        """Summarize a thread within the remaining time budget, or return None if that isn't possible."""
+        timeout = min(self.summary_timeout, deadline.remaining())
+        if timeout <= 1.0:
+            logging.warning("Not enough time left to summarize thread - skipping summary")
+            return None
+        try:
+            with tracer.span("summarize"):
+                return self.ollama.summarize_thread(
+                    thread_messages,
+                    thread_id=thread_ts,  # Pass the thread timestamp as identifier
+                    timeout=timeout
+                )
+        except Exception as e:
+            logging.warning(f"Skipping summary, Ollama unavailable: {str(e)}")
+            return None
+
+    def _summary_candidates(self, similar_messages: List[dict]) -> List[dict]:
+        """Distinct questions scoring within the similarity gap of the best match, best first.
+
+        A question posted again with the same text (ignoring case and whitespace) only
+        keeps its best scoring copy.
+        """
+        best_similarity = similar_messages[0]["similarity"]
+        candidates = []
+        seen_texts = set()
+        for msg in similar_messages:
+            if len(candidates) >= self.max_summaries:
+                break
+            if best_similarity - msg["similarity"] > self.summary_similarity_gap:
+                break
+            text = " ".join(msg["text"].split()).lower()
+            if text not in seen_texts:
+                seen_texts.add(text)
+                candidates.append(msg)
+        return candidates
+
+    @staticmethod
+    def _distinct_threads(candidates: List[dict],
+                          threads: List[List[str]]) -> Tuple[List[dict], List[List[str]]]:
+        """Drop candidates whose fetched thread repeats the thread of a better candidate.
+
+        Candidates pointing into the same thread fetch the same messages, which would
+        otherwise be summarized twice.
+        """
+        kept_candidates, kept_threads = [], []
+        seen = set()
+        for msg, thread in zip(candidates, threads):
+            key = tuple(thread)
+            if thread and key in seen:
+                continue
+            seen.add(key)
+            kept_candidates.append(msg)
+            kept_threads.append(thread)
+        return kept_candidates, kept_threads
+
+    def _single_candidate_response(self, best_match: dict, channel_id: str,
+                                   level: DegradationLevel, deadline: Deadline,
+                                   thread_messages: Optional[List[str]] = None) -> str:
+        """Build the reply for a single similar question.
+
+        Args:
+            thread_messages: The thread of best_match, if it was already fetched
+        """
+        similarity_percentage = best_match["similarity"] * 100
+        
+        # Skip the thread fetch if the Slack call could not finish in time
+        if level < DegradationLevel.NO_THREAD and deadline.remaining() < self.slack_timeout:
+            level = DegradationLevel.NO_THREAD
+        
+        # Get the thread messages for the best match, unless they were already fetched
+        if thread_messages is None:
+            thread_messages = []
+            if level < DegradationLevel.NO_THREAD:
+                thread_messages = self._fetch_thread(channel_id, best_match["ts"], deadline)
+        
+        # Generate a summary of the thread
+        summary = None
+        if thread_messages and level == DegradationLevel.FULL:
+            summary = self._summarize(thread_messages, best_match["ts"], deadline)
+        
+        if summary is not None:
+            return (
+                f"I found a similar question that was asked before! "
+                f"(Similarity: {similarity_percentage:.1f}%)\n"
+                f"You can find it here: {best_match['permalink']}\n\n"
+                f"Here's a summary of the previous answer:\n"
+                f"```\n{summary}\n```"
+            )
+        elif len(thread_messages) > 1:
+            return (
+                f"I found a similar question that was asked before! "
+                f"(Similarity: {similarity_percentage:.1f}%)\n"
+                f"You can find it here: {best_match['permalink']}\n"
+                f"That thread has {len(thread_messages) - 1} replies."
+            )
+        return (
+            f"I found a similar question that was asked before! "
+            f"(Similarity: {similarity_percentage:.1f}%)\n"
+            f"You can find it here: {best_match['permalink']}"
+        )
+
+    def _multi_candidate_response(self, candidates: List[dict], channel_id: str,
+                                  level: DegradationLevel, deadline: Deadline) -> str:
+        """Build the reply for several similarly scored questions, summarizing each thread."""
+        if level < DegradationLevel.NO_THREAD and deadline.remaining() < self.slack_timeout:
+            level = DegradationLevel.NO_THREAD
+
+        threads: List[List[str]] = [[] for _ in candidates]
+        if level < DegradationLevel.NO_THREAD:
+            threads = list(self._summary_pool.map(
+                tracer.wrap(lambda msg: self._fetch_thread(channel_id, msg["ts"], deadline)),
+                candidates
+            ))
+            candidates, threads = self._distinct_threads(candidates, threads)
+            if len(candidates) == 1:
+                return self._single_candidate_response(candidates[0], channel_id, level, deadline, threads[0])
+
+        summaries: List[Optional[str]] = [None] * len(candidates)
+        if level == DegradationLevel.FULL:
+            if self.summary_mode == "combined":
+                summaries = self._summarize_combined(threads, deadline)
+            else:
+                with tracer.span("summarize_candidates"):
+                    summaries = list(self._summary_pool.map(
+                        tracer.wrap(lambda args: self._summarize(args[0], args[1]["ts"], deadline) if args[0] else None),
+                        zip(threads, candidates)
+                    ))
+
+        lines = [f"I found {len(candidates)} similar questions that were asked before!"]
+        for number, (msg, thread, summary) in enumerate(zip(candidates, threads, summaries), start=1):
+            lines.append(f"{number}. (Similarity: {msg['similarity'] * 100:.1f}%) {msg['permalink']}")
+            if summary is not None:
+                lines.append(f"```\n{summary}\n```")
+            elif len(thread) > 1:
+                lines.append(f"That thread has {len(thread) - 1} replies.")
+        return "\n".join(lines)
+
+    def _summarize_combined(self, threads: List[List[str]], deadline: Deadline) -> List[Optional[str]]:
+        """Summarize all threads in one Ollama request within the remaining time budget."""
+        timeout = min(self.summary_timeout, deadline.remaining())
+        if timeout <= 1.0:
+            logging.warning("Not enough time left to summarize threads - skipping summaries")
+            return [None] * len(threads)
+        try:
+            with tracer.span("summarize"):
+                return self.ollama.summarize_threads(threads, timeout=timeout)
+        except Exception as e:
+            logging.warning(f"Skipping summaries, Ollama unavailable: {str(e)}")
+            return [None] * len(threads)
+
+    def _process_message(self, message: dict, channel_id: str, deadline: Optional[Deadline] = None) -> None:
         """Process a message and find similar previous messages."""
+        deadline = deadline or Deadline(self.request_timeout)
+        level = self._degradation_level(deadline)
+        if level > DegradationLevel.FULL:
+            logging.info(f"Degrading message processing to {level.name}")
         try:
+            if level >= DegradationLevel.ACK_ONLY:
+                self.client.chat_postMessage(
+                    channel=channel_id,
+                    thread_ts=message.get("ts"),
+                    text="Thanks for your question! I'm handling a lot of messages right now, "
+                         "so I couldn't look for similar questions this time."
+                )
+                # Indexing costs a permalink lookup and an encode, so it is left until the
+                # load has dropped
+                self._defer_indexing(message, channel_id)
+                return
+
             # First check for similar messages
             similar_messages = self.vector_store.find_similar_messages(
                 message["text"],
-                threshold=self.similarity_threshold
+                threshold=self.similarity_threshold,
+                limit=max(self.max_candidates, self.max_summaries)
             )
 
             # Filter out the current message if it somehow got into the results
@@ -94,36 +404,12 @@ class MessageHandler:
 
             # Send appropriate response based on whether similar messages were found
             if similar_messages:
-                # Get the most similar message
-                best_match = similar_messages[0]
-                similarity_percentage = best_match["similarity"] * 100
-                
-                # Get the thread messages for the best match
-                thread_messages = self.vector_store.get_thread_messages(
-                    channel_id,
-                    best_match["ts"]
-                )
-                
-                # Generate a summary of the thread
-                if thread_messages:
-                    summary = self.ollama.summarize_thread(
-                        thread_messages,
-                        thread_id=best_match["ts"]  # Pass the thread timestamp as identifier
-                    )
-                    
-                    response = (
-                        f"I found a similar question that was asked before! "
-                        f"(Similarity: {similarity_percentage:.1f}%)\n"
-                        f"You can find it here: {best_match['permalink']}\n\n"
-                        f"Here's a summary of the previous answer:\n"
-                        f"```\n{summary}\n```"
-                    )
+                # Summarize several threads when other candidates score almost as high as the best
+                candidates = self._summary_candidates(similar_messages)
+                if len(candidates) > 1:
+                    response = self._multi_candidate_response(candidates, channel_id, level, deadline)
                 else:
-                    response = (
-                        f"I found a similar question that was asked before! "
-                        f"(Similarity: {similarity_percentage:.1f}%)\n"
-                        f"You can find it here: {best_match['permalink']}"
-                    )
+                    response = self._single_candidate_response(similar_messages[0], channel_id, level, deadline)
                 
                 self.client.chat_postMessage(
                     channel=channel_id,
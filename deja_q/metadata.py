@@ -0,0 +1,283 @@
+import json
+import os
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Union
+import numpy as np
+
+
+def _grow(array: np.ndarray, needed: int) -> np.ndarray:
+    """Return a writable copy of array with room for at least needed rows."""
+    capacity = max(needed, 2 * len(array), 1024)
+    grown = np.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+def save_concatenated(path: str, parts: Sequence[np.ndarray]) -> None:
+    """Write parts as one .npy array without concatenating them in memory.
+
+    The file is written under a temporary name and then renamed, so a memory-mapped copy
+    of the old file stays valid.
+    """
+    total = sum(len(part) for part in parts)
+    tmp_path = path + ".tmp"
+    if total == 0:
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.empty((0,) + parts[0].shape[1:], dtype=parts[0].dtype))
+    else:
+        out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=parts[0].dtype,
+                                        shape=(total,) + parts[0].shape[1:])
+        start = 0
+        for part in parts:
+            out[start:start + len(part)] = part
+            start += len(part)
+        out.flush()
+        del out
+    os.replace(tmp_path, path)
+
+
+class AppendableRows:
+    def __init__(self, base: np.ndarray):
+        """Rows of a base array, which may be read-only or memory-mapped, followed by appended rows.
+
+        Appended rows go to a separate in-memory tail, so the base is never copied.
+
+        Args:
+            base: Initial rows
+        """
+        self.base = base
+        self._tail = np.empty((0,) + base.shape[1:], dtype=base.dtype)
+        self._tail_count = 0
+
+    def __len__(self) -> int:
+        return len(self.base) + self._tail_count
+
+    @property
+    def shape(self):
+        return (len(self),) + self.base.shape[1:]
+
+    def append(self, rows: np.ndarray) -> None:
+        """Append rows, an array whose first axis indexes the rows."""
+        needed = self._tail_count + len(rows)
+        if needed > len(self._tail):
+            self._tail = _grow(self._tail[:self._tail_count], needed)
+        self._tail[self._tail_count:needed] = rows
+        self._tail_count = needed
+
+    def tail(self) -> np.ndarray:
+        """The appended rows."""
+        return self._tail[:self._tail_count]
+
+    def segments(self, start: int = 0, end: Optional[int] = None) -> List[np.ndarray]:
+        """Rows start to end as views of the base and the tail, without copying them."""
+        end = len(self) if end is None else min(end, len(self))
+        base_count = len(self.base)
+        parts = []
+        if start < base_count:
+            parts.append(self.base[start:min(end, base_count)])
+        if end > base_count:
+            parts.append(self._tail[max(start - base_count, 0):end - base_count])
+        return parts
+
+    def __getitem__(self, i: int):
+        if i < 0:
+            i += len(self)
+        if i < len(self.base):
+            return self.base[i]
+        if i >= len(self):
+            raise IndexError("row index out of range")
+        return self._tail[i - len(self.base)]
+
+    def to_array(self, end: Optional[int] = None) -> np.ndarray:
+        """Rows up to end as one array; the base itself if no rows were appended."""
+        parts = self.segments(0, end)
+        if len(parts) == 1:
+            return parts[0]
+        if not parts:
+            return self.base[:0]
+        return np.concatenate(parts)
+
+    def save(self, path: str, end: Optional[int] = None) -> None:
+        """Write rows up to end to a .npy file."""
+        save_concatenated(path, self.segments(0, end) or [self.base[:0]])
+
+
+class _StringColumn:
+    def __init__(self):
+        """Strings stored back to back as UTF-8, located through an offsets array.
+
+        Loaded strings stay in their (possibly memory-mapped) buffer, appended strings go to
+        an in-memory tail buffer.
+        """
+        self._base_data = np.empty(0, dtype=np.uint8)
+        self._base_offsets = np.zeros(1, dtype=np.int64)
+        self._base_count = 0
+        self._data = bytearray()
+        self._offsets = np.zeros(1024, dtype=np.int64)
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._base_count + self._count
+
+    def append(self, value: Optional[str]) -> None:
+        if self._count + 2 > len(self._offsets):
+            self._offsets = _grow(self._offsets[:self._count + 1], self._count + 2)
+        self._data.extend((value or "").encode("utf-8"))
+        self._offsets[self._count + 1] = len(self._data)
+        self._count += 1
+
+    def __getitem__(self, i: int) -> str:
+        if i < self._base_count:
+            start, end = self._base_offsets[i], self._base_offsets[i + 1]
+            return self._base_data[start:end].tobytes().decode("utf-8")
+        i -= self._base_count
+        start, end = self._offsets[i], self._offsets[i + 1]
+        return bytes(self._data[start:end]).decode("utf-8")
+
+    def save(self, path: str, name: str, count: Optional[int] = None) -> None:
+        """Write the first count strings."""
+        count = len(self) if count is None else count
+        base_count = min(count, self._base_count)
+        tail_count = count - base_count
+        base_end = int(self._base_offsets[base_count])
+        tail_end = int(self._offsets[tail_count])
+        save_concatenated(os.path.join(path, f"{name}.npy"), [
+            np.asarray(self._base_data[:base_end], dtype=np.uint8),
+            np.frombuffer(bytes(self._data[:tail_end]), dtype=np.uint8),
+        ])
+        save_concatenated(os.path.join(path, f"{name}_offsets.npy"), [
+            np.asarray(self._base_offsets[:base_count + 1]),
+            self._offsets[1:tail_count + 1] + base_end,
+        ])
+
+    @classmethod
+    def load(cls, path: str, name: str, mmap: bool = False) -> "_StringColumn":
+        mmap_mode = "r" if mmap else None
+        column = cls()
+        column._base_data = np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+        column._base_offsets = np.load(os.path.join(path, f"{name}_offsets.npy"), mmap_mode=mmap_mode)
+        column._base_count = len(column._base_offsets) - 1
+        return column
+
+
+class MessageMetadata:
+    def __init__(self, messages: Optional[Iterable[Dict]] = None):
+        """Columnar storage for message metadata.
+
+        Timestamps are kept as a float array, user ids are interned into an integer array
+        and texts and permalinks live in offset-indexed UTF-8 buffers. Message dicts are only
+        built when a row is read.
+
+        Args:
+            messages: Optional message dicts with text, ts, permalink and user keys
+        """
+        self._count = 0
+        self._ts = AppendableRows(np.empty(0, dtype=np.float64))
+        self._user = AppendableRows(np.empty(0, dtype=np.int32))
+        self._user_names: List[str] = []
+        self._user_ids: Dict[str, int] = {}
+        self._text = _StringColumn()
+        self._permalink = _StringColumn()
+        if messages is not None:
+            self.extend(messages)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, message: Dict) -> None:
+        """Add a message dict with text, ts, permalink and user keys."""
+        self._ts.append(np.array([float(message["ts"])]))
+        self._user.append(np.array([self._intern_user(message.get("user"))]))
+        self._text.append(message["text"])
+        self._permalink.append(message.get("permalink"))
+        self._count += 1
+
+    def extend(self, messages: Iterable[Dict]) -> None:
+        for message in messages:
+            self.append(message)
+
+    def _intern_user(self, user: Optional[str]) -> int:
+        if user is None:
+            return -1
+        if user not in self._user_ids:
+            self._user_ids[user] = len(self._user_names)
+            self._user_names.append(user)
+        return self._user_ids[user]
+
+    def ts(self, i: int) -> str:
+        """Slack timestamp string of message i."""
+        return f"{self._ts[i]:.6f}"
+
+    def text(self, i: int) -> str:
+        return self._text[i]
+
+    def texts(self, start: int = 0, end: Optional[int] = None) -> List[str]:
+        """Texts of messages start to end, without building full message dicts."""
+        end = self._count if end is None else min(end, self._count)
+        return [self._text[i] for i in range(start, end)]
+
+    def timestamps(self) -> np.ndarray:
+        """Timestamps of all messages as floats."""
+        return self._ts.to_array(self._count)
+
+    def latest_ts(self) -> Optional[str]:
+        """Timestamp of the newest message, or None if there are no messages."""
+        if not self._count:
+            return None
+        latest = max(float(segment.max()) for segment in self._ts.segments(0, self._count) if len(segment))
+        return f"{latest:.6f}"
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[Dict, List[Dict]]:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._count))]
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("message index out of range")
+        user = int(self._user[i])
+        return {
+            "text": self._text[i],
+            "ts": self.ts(i),
+            "permalink": self._permalink[i],
+            "user": self._user_names[user] if user >= 0 else None
+        }
+
+    def __iter__(self) -> Iterator[Dict]:
+        for i in range(self._count):
+            yield self[i]
+
+    def save(self, path: str, count: Optional[int] = None) -> None:
+        """Write the first count messages (all by default) to .npy files in path.
+
+        Rows are only ever appended, so this is safe while other threads append messages
+        as long as count was read under the same lock as the appends.
+        """
+        count = self._count if count is None else count
+        os.makedirs(path, exist_ok=True)
+        self._ts.save(os.path.join(path, "ts.npy"), count)
+        self._user.save(os.path.join(path, "user.npy"), count)
+        with open(os.path.join(path, "users.json.tmp"), "w") as f:
+            json.dump(self._user_names[:], f)
+        os.replace(os.path.join(path, "users.json.tmp"), os.path.join(path, "users.json"))
+        self._text.save(path, "text", count)
+        self._permalink.save(path, "permalink", count)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = False) -> "MessageMetadata":
+        """Load columns written by save.
+
+        Args:
+            path: Directory the columns were saved to
+            mmap: Memory-map the arrays instead of reading them into memory. Messages appended
+                later are kept in memory next to the mapped columns.
+        """
+        mmap_mode = "r" if mmap else None
+        metadata = cls()
+        metadata._ts = AppendableRows(np.load(os.path.join(path, "ts.npy"), mmap_mode=mmap_mode))
+        metadata._user = AppendableRows(np.load(os.path.join(path, "user.npy"), mmap_mode=mmap_mode))
+        with open(os.path.join(path, "users.json")) as f:
+            metadata._user_names = json.load(f)
+        metadata._user_ids = {user: i for i, user in enumerate(metadata._user_names)}
+        metadata._text = _StringColumn.load(path, "text", mmap)
+        metadata._permalink = _StringColumn.load(path, "permalink", mmap)
+        metadata._count = len(metadata._ts)
+        return metadata
@@ -1,17 +1,29 @@
+import re
 import requests
 import logging
 from typing import Optional, List, Dict
+from .cache import LRUCache
+from .profiling import tracer
+from .resilience import CircuitBreaker
 
 class OllamaClient:
-    def __init__(self, base_url: str = "http://localhost:11434", model: str = "mistral"):
+    def __init__(self, base_url: str = "http://localhost:11434", model: str = "mistral",
+                 timeout: float = 60.0, breaker: Optional[CircuitBreaker] = None,
+                 summary_cache_size: int = 256):
         """Initialize Ollama client.
         
         Args:
             base_url: The base URL for Ollama API
             model: The model to use for generation
+            timeout: Default request timeout in seconds
+            breaker: Optional circuit breaker guarding calls to Ollama
+            summary_cache_size: Number of thread summaries to cache, keyed by thread content
         """
         self.base_url = base_url.rstrip('/')
         self.model = model
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker("ollama")
+        self.summary_cache = LRUCache(summary_cache_size)
         
         # Configure logging format
         self.logger = logging.getLogger(__name__)
@@ -35,16 +47,25 @@ class OllamaClient:
         self.logger.info(f"{response}")
         self.logger.info(f"{'='*80}\n")
 
-    def generate(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+    def generate(self, prompt: str, system_prompt: Optional[str] = None,
+                 timeout: Optional[float] = None) -> str:
         """Generate a response using Ollama.
         
         Args:
             prompt: The user prompt
             system_prompt: Optional system prompt to guide the model's behavior
+            timeout: Optional request timeout in seconds, overriding the client default
         
         Returns:
             The generated response
+            
+        Raises:
+            CircuitOpenError: If Ollama has been failing and calls are currently suspended
         """
+        with tracer.span("ollama.generate"):
+            return self.breaker.call(self._generate, prompt, system_prompt, timeout)
+
+    def _generate(self, prompt: str, system_prompt: Optional[str], timeout: Optional[float]) -> str:
         try:
             url = f"{self.base_url}/api/generate"
             
@@ -58,7 +79,7 @@ class OllamaClient:
             if system_prompt:
                 payload["system"] = system_prompt
             
-            response = requests.post(url, json=payload)
+            response = requests.post(url, json=payload, timeout=timeout or self.timeout)
             response.raise_for_status()
             
             return response.json()["response"]
@@ -115,12 +136,14 @@ Always respond with a single line of text containing only information from the t
             "system": system_prompt
         }
 
-    def summarize_thread(self, messages: List[str], thread_id: Optional[str] = None) -> str:
+    def summarize_thread(self, messages: List[str], thread_id: Optional[str] = None,
+                         timeout: Optional[float] = None) -> str:
         """Summarize a thread of messages.
         
         Args:
             messages: List of messages in the thread, where messages[0] is the question
             thread_id: Optional identifier for the thread (e.g. Slack thread timestamp)
+            timeout: Optional request timeout in seconds
         
         Returns:
             A summary of the answer(s) found in the thread
@@ -129,18 +152,108 @@ Always respond with a single line of text containing only information from the t
             if len(messages) < 2:
                 return "No answers found in the thread."
 
+            # Reuse the summary if this exact thread was summarized before
+            cache_key = (self.model, tuple(messages))
+            cached = self.summary_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
             # Get the prepared prompts
             prompts = self.prepare_prompt(messages)
             
             # Generate the summary
-            response = self.generate(prompts["prompt"], prompts["system"])
+            response = self.generate(prompts["prompt"], prompts["system"], timeout=timeout)
             
             # Log the interaction
             thread_identifier = thread_id or messages[0][:50] + "..."
             self._log_interaction(thread_identifier, prompts, response)
             
+            self.summary_cache.put(cache_key, response)
             return response
             
         except Exception as e:
             logging.error(f"Error summarizing thread: {str(e)}")
-            raise 
\ No newline at end of file
+            raise
+
+    def prepare_combined_prompt(self, threads: List[List[str]]) -> Dict[str, str]:
+        """Prepare one prompt that summarizes several threads at once.
+        
+        Args:
+            threads: Lists of messages, one per thread, where messages[0] is the question
+            
+        Returns:
+            Dict containing 'prompt' and 'system' keys with the formatted prompts
+        """
+        sections = []
+        for number, messages in enumerate(threads, start=1):
+            sections.append(f"""Thread {number}:
+Question: {messages[0]}
+Thread Messages:
+{chr(10).join(f'- {response}' for response in messages[1:])}""")
+
+        prompt = f"""Extract only information that is explicitly mentioned in these threads.
+
+{(chr(10) * 2).join(sections)}
+
+Instructions:
+- For each thread, write exactly one line starting with "Thread <number>:" followed by a summary
+- Use ONLY information stated in that thread's messages
+- Include specific technical details that were mentioned
+- Do not add external knowledge or make assumptions
+- If a thread has no relevant information, say "No relevant information found" for it
+
+One line per thread:"""
+
+        system_prompt = """You are a precise information extractor that only reports what was explicitly stated in thread messages.
+Restrict yourself to ONLY information that appears in the messages - do not add external knowledge or make assumptions.
+Focus on being accurate to what was actually said rather than being comprehensive.
+Always respond with one line per thread, each starting with "Thread <number>:"."""
+
+        return {
+            "prompt": prompt,
+            "system": system_prompt
+        }
+
+    def summarize_threads(self, threads: List[List[str]], timeout: Optional[float] = None) -> List[Optional[str]]:
+        """Summarize several threads with a single request.
+        
+        Threads that were summarized before are served from the summary cache and left
+        out of the request.
+        
+        Args:
+            threads: Lists of messages, one per thread, where messages[0] is the question
+            timeout: Optional request timeout in seconds
+            
+        Returns:
+            One summary per thread, None where the model's response had no line for it
+        """
+        summaries: List[Optional[str]] = [None] * len(threads)
+        pending = []
+        for i, messages in enumerate(threads):
+            if len(messages) < 2:
+                summaries[i] = "No answers found in the thread."
+                continue
+            cached = self.summary_cache.get((self.model, tuple(messages)))
+            if cached is not None:
+                summaries[i] = cached
+            else:
+                pending.append(i)
+
+        if len(pending) == 1:
+            i = pending[0]
+            summaries[i] = self.summarize_thread(threads[i], timeout=timeout)
+        elif pending:
+            try:
+                prompts = self.prepare_combined_prompt([threads[i] for i in pending])
+                response = self.generate(prompts["prompt"], prompts["system"], timeout=timeout)
+                self._log_interaction(f"{len(pending)} threads", prompts, response)
+            except Exception as e:
+                logging.error(f"Error summarizing threads: {str(e)}")
+                raise
+            for line in response.splitlines():
+                match = re.match(r"\s*[-*]*\s*Thread (\d+)\**:\**\s*(.+)", line)
+                if match and 1 <= int(match.group(1)) <= len(pending):
+                    i = pending[int(match.group(1)) - 1]
+                    summaries[i] = match.group(2).strip()
+                    self.summary_cache.put((self.model, tuple(threads[i])), summaries[i])
+        return summaries 
\ No newline at end of file
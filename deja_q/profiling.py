@@ -0,0 +1,300 @@
+import atexit
+import heapq
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.01):
+        """Periodically sample the stacks of all threads.
+
+        Samples are aggregated as collapsed stacks ("frame;frame;frame count"), the input
+        format of flamegraph.pl, speedscope and similar tools.
+
+        Args:
+            interval: Seconds between samples
+        """
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _collapse(frame) -> str:
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+            frame = frame.f_back
+        return ";".join(reversed(frames))
+
+    def _sample(self) -> None:
+        own_id = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            self.samples[f"{names.get(thread_id, thread_id)};{self._collapse(frame)}"] += 1
+
+    def _run(self, seconds: float) -> None:
+        deadline = time.monotonic() + seconds
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            self._sample()
+            self._stop.wait(self.interval)
+
+    def start(self, seconds: float) -> None:
+        """Sample for the given number of seconds on a background thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(seconds,), name="deja-q-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def join(self) -> None:
+        if self._thread:
+            self._thread.join()
+
+    def write_collapsed(self, path: str) -> None:
+        """Write the samples as collapsed stacks, one "stack count" line each."""
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class Trace:
+    def __init__(self, name: str, **attributes):
+        """Timed spans recorded while processing one event."""
+        self.name = name
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.duration: Optional[float] = None
+        # (name, parent index, start offset, duration); index 0 is the trace itself
+        self.spans: List[Tuple[str, int, float, float]] = []
+        # Spans may be recorded from worker threads the trace was handed to
+        self.lock = threading.Lock()
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "attributes": self.attributes,
+            "duration": self.duration,
+            "spans": [
+                {"name": name, "parent": parent, "start": start, "duration": duration}
+                for name, parent, start, duration in self.spans
+            ],
+        }
+
+
+class Tracer:
+    def __init__(self, enabled: bool = False, keep_slowest: int = 20):
+        """Record per-event trace spans and keep the slowest traces.
+
+        Args:
+            enabled: Whether traces are recorded
+            keep_slowest: Number of slowest traces kept for dumping
+        """
+        self.enabled = enabled
+        self.keep_slowest = keep_slowest
+        self._slowest: List[Tuple[float, int, Trace]] = []
+        self._finished = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def trace(self, name: str, **attributes) -> Iterator[Optional[Trace]]:
+        """Record a trace for the code inside the block, on the current thread."""
+        if not self.enabled:
+            yield None
+            return
+        trace = Trace(name, **attributes)
+        self._local.trace = trace
+        self._local.stack = [0]
+        try:
+            yield trace
+        finally:
+            trace.duration = time.perf_counter() - trace.start
+            self._local.trace = None
+            self._finish(trace)
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        """Time the code inside the block as a span of the current trace, if there is one."""
+        trace = getattr(self._local, "trace", None)
+        if trace is None:
+            yield
+            return
+        stack = self._local.stack
+        parent = stack[-1]
+        start = time.perf_counter()
+        with trace.lock:
+            index = len(trace.spans) + 1
+            trace.spans.append((name, parent, start - trace.start, 0.0))
+        stack.append(index)
+        try:
+            yield
+        finally:
+            stack.pop()
+            with trace.lock:
+                trace.spans[index - 1] = (name, parent, start - trace.start, time.perf_counter() - start)
+
+    def add_span(self, name: str, duration: float) -> None:
+        """Record a span that was timed elsewhere (e.g. time spent queued) at the start of the trace."""
+        trace = getattr(self._local, "trace", None)
+        if trace is not None:
+            with trace.lock:
+                trace.spans.append((name, 0, 0.0, duration))
+
+    def wrap(self, func: Callable) -> Callable:
+        """Wrap func so its spans join the current trace and span, on whichever thread it runs.
+
+        Traces are kept per thread, so work handed to a thread pool needs this to be recorded.
+        """
+        trace = getattr(self._local, "trace", None)
+        if trace is None:
+            return func
+        parent = self._local.stack[-1]
+
+        def wrapped(*args, **kwargs):
+            previous = getattr(self._local, "trace", None), getattr(self._local, "stack", None)
+            self._local.trace, self._local.stack = trace, [parent]
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._local.trace, self._local.stack = previous
+
+        return wrapped
+
+    def _finish(self, trace: Trace) -> None:
+        with self._lock:
+            self._finished += 1
+            entry = (trace.duration, self._finished, trace)
+            if len(self._slowest) < self.keep_slowest:
+                heapq.heappush(self._slowest, entry)
+            else:
+                heapq.heappushpop(self._slowest, entry)
+
+    def slowest(self) -> List[Trace]:
+        """The slowest traces recorded so far, slowest first."""
+        with self._lock:
+            return [trace for _, _, trace in sorted(self._slowest, reverse=True)]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._slowest = []
+
+    def start_flushing(self, output_dir: str, interval: float = 60.0) -> None:
+        """Write the slowest traces to output_dir every interval seconds and when the process exits."""
+        os.makedirs(output_dir, exist_ok=True)
+
+        def flush() -> None:
+            try:
+                self.write_traces(os.path.join(output_dir, "traces.json"))
+                self.write_collapsed(os.path.join(output_dir, "traces.collapsed"))
+            except Exception as e:
+                logging.error(f"Error writing traces: {str(e)}")
+
+        def run() -> None:
+            while True:
+                time.sleep(interval)
+                flush()
+
+        threading.Thread(target=run, name="deja-q-trace-flush", daemon=True).start()
+        atexit.register(flush)
+
+    def write_traces(self, path: str) -> None:
+        """Write the slowest traces as JSON."""
+        with open(path, "w") as f:
+            json.dump([trace.to_dict() for trace in self.slowest()], f, indent=2)
+
+    def write_collapsed(self, path: str) -> None:
+        """Write the slowest traces as collapsed stacks weighted by self time in microseconds."""
+        weights: Counter = Counter()
+        for trace in self.slowest():
+            names = [trace.name] + [span[0] for span in trace.spans]
+            parents = [-1] + [span[1] for span in trace.spans]
+            durations = [trace.duration or 0.0] + [span[3] for span in trace.spans]
+            self_times = list(durations)
+            for i, parent in enumerate(parents):
+                if parent >= 0:
+                    self_times[parent] -= durations[i]
+            for i in range(len(names)):
+                path_names, j = [], i
+                while j >= 0:
+                    path_names.append(names[j])
+                    j = parents[j]
+                weights[";".join(reversed(path_names))] += max(0, int(self_times[i] * 1e6))
+        with open(path, "w") as f:
+            for stack, weight in weights.most_common():
+                f.write(f"{stack} {weight}\n")
+
+
+# Process-wide tracer used by the handler, vector store and clients
+tracer = Tracer(enabled=os.getenv("DEJA_Q_TRACE", "").lower() in ("1", "true", "yes"))
+
+
+class ProfileInProgressError(Exception):
+    """Raised when a profiling session is started while another one is running."""
+
+
+# Sessions share the global tracer, so only one may run at a time
+_session_lock = threading.Lock()
+_session_ids = itertools.count(1)
+
+
+def profile_session(seconds: float, output_dir: str, interval: float = 0.01) -> Dict[str, str]:
+    """Run the sampling profiler and trace capture for a number of seconds in the background.
+
+    When the session ends the samples, the slowest traces and a flamegraph of those traces
+    are written to output_dir.
+
+    Returns:
+        Paths of the files that will be written
+
+    Raises:
+        ProfileInProgressError: If another session has not finished yet
+    """
+    if not _session_lock.acquire(blocking=False):
+        raise ProfileInProgressError("A profiling session is already running")
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+    except Exception:
+        _session_lock.release()
+        raise
+    stamp = f"{time.strftime('%Y%m%d-%H%M%S')}-{next(_session_ids)}"
+    paths = {
+        "profile": os.path.join(output_dir, f"profile-{stamp}.collapsed"),
+        "traces": os.path.join(output_dir, f"traces-{stamp}.json"),
+        "trace_flamegraph": os.path.join(output_dir, f"traces-{stamp}.collapsed"),
+    }
+    profiler = SamplingProfiler(interval)
+    was_enabled = tracer.enabled
+    tracer.reset()
+    tracer.enabled = True
+    profiler.start(seconds)
+
+    def finish() -> None:
+        profiler.join()
+        tracer.enabled = was_enabled
+        try:
+            profiler.write_collapsed(paths["profile"])
+            tracer.write_traces(paths["traces"])
+            tracer.write_collapsed(paths["trace_flamegraph"])
+            logging.info(f"Wrote profile and traces to {output_dir}")
+        except Exception as e:
+            logging.error(f"Error writing profile: {str(e)}")
+        finally:
+            _session_lock.release()
+
+    threading.Thread(target=finish, name="deja-q-profile-writer", daemon=True).start()
+    return paths
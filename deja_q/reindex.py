@@ -0,0 +1,106 @@
+import logging
+import os
+import threading
+import time
+from typing import Optional
+import numpy as np
+from sentence_transformers import SentenceTransformer
+from .encoder import BulkEncoder
+from .vector_store import MessageVectorStore
+
+
+class ReindexJob:
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, vector_store: MessageVectorStore, model_name: str, cpu_budget: float = 0.25,
+                 model: Optional[SentenceTransformer] = None):
+        """Re-encode every message with a different embedding model in the background.
+
+        The vector store keeps serving queries from its current model and embeddings while
+        the job runs. When the new embeddings are complete the store swaps to them in one step.
+        If an index for the new model was already saved, it is loaded instead of re-encoding.
+
+        Args:
+            vector_store: The store to re-index
+            model_name: Name of the new embedding model
+            cpu_budget: Fraction of the machine's CPU time (all cores) the job may use (0-1];
+                the job sleeps between batches to stay within it
+            model: Optional already loaded model, loaded from model_name if not given
+        """
+        if not 0 < cpu_budget <= 1:
+            raise ValueError("cpu_budget must be in (0, 1]")
+        self.vector_store = vector_store
+        self.model_name = model_name
+        self.cpu_budget = cpu_budget
+        self.model = model
+        self.state = self.PENDING
+        self.processed = 0
+        self.total = 0
+        self.cpu_count = os.cpu_count() or 1
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "ReindexJob":
+        """Run the job on a background thread."""
+        self._thread = threading.Thread(target=self.run, name="deja-q-reindex", daemon=True)
+        self._thread.start()
+        return self
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _pause_for(self, wall: float, cpu: float) -> float:
+        """Seconds to sleep after a batch that took wall seconds and cpu seconds of process CPU time.
+
+        The model may use every core while encoding, so the budget is checked against the CPU
+        time of the whole process rather than the time the batch took.
+        """
+        return max(0.0, cpu / (self.cpu_budget * self.cpu_count) - wall)
+
+    def run(self) -> None:
+        """Build the new index and swap it into the vector store."""
+        self.state = self.RUNNING
+        try:
+            if self.model is None:
+                self.model = SentenceTransformer(self.model_name)
+
+            # A previous run may have finished before a restart, then only catch up
+            if self.vector_store.load_index(self.model_name, self.model):
+                logging.info(f"Switched to the saved index for {self.model_name}")
+                if self.vector_store._catch_up():
+                    self.vector_store.save_index()
+                self.state = self.DONE
+                return
+
+            # Messages added while the job runs are picked up by swap_model
+            with self.vector_store._lock:
+                texts = self.vector_store.messages.texts()
+            self.total = len(texts)
+            logging.info(f"Re-indexing {self.total} messages with {self.model_name} (CPU budget {self.cpu_budget:.0%})")
+
+            embeddings = None
+            encoder = BulkEncoder(self.model)
+            batch_started, cpu_started = time.perf_counter(), time.process_time()
+            for indices, batch in encoder.encode(texts):
+                if embeddings is None:
+                    embeddings = np.empty((len(texts), batch.shape[1]), dtype=np.float32)
+                embeddings[indices] = batch
+                self.processed += len(indices)
+
+                # Sleep long enough that encoding uses at most cpu_budget of the CPU time
+                time.sleep(self._pause_for(time.perf_counter() - batch_started,
+                                           time.process_time() - cpu_started))
+                batch_started, cpu_started = time.perf_counter(), time.process_time()
+
+            if embeddings is None:
+                dim = self.model.get_sentence_embedding_dimension()
+                embeddings = np.empty((0, dim), dtype=np.float32)
+            self.vector_store.swap_model(self.model_name, self.model, embeddings, len(texts))
+            self.state = self.DONE
+            logging.info(f"Re-index with {self.model_name} complete")
+        except Exception as e:
+            self.state = self.FAILED
+            logging.error(f"Error re-indexing with {self.model_name}: {str(e)}")
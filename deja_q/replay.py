@@ -0,0 +1,319 @@
+"""
+Replay historical questions through the search path offline, without posting to Slack.
+
+Every top-level message is treated as a new question, in chronological order, and
+matched against the messages posted before it. The report shows for each similarity
+threshold how often the bot would have answered and how often the matched thread
+actually had replies from people, together with per-stage latency.
+
+Usage:
+    python -m deja_q.replay --export path/to/slack-export --channel prototype
+    python -m deja_q.replay --index index/prototype/all-MiniLM-L6-v2
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from .cache import LRUCache
+from .encoder import BulkEncoder
+from .metadata import MessageMetadata
+from .slack_client import SlackClient
+from .vector_store import DEFAULT_EMBEDDING_MODEL, MessageVectorStore
+
+DEFAULT_THRESHOLDS = [0.5, 0.55, 0.6, 0.65, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95]
+
+
+def load_export(path: str, channel: Optional[str] = None) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """Load the top-level messages of a channel from a Slack export.
+
+    Args:
+        path: Export root directory, or the directory of a single channel
+        channel: Channel name, required when path is the export root
+
+    Returns:
+        (texts, timestamps, answered) sorted by timestamp, where answered is True for
+        messages whose thread has replies from people. Replies from bots, including Deja Q's
+        own, don't count.
+    """
+    channel_dir = os.path.join(path, channel) if channel else path
+    files = sorted(glob.glob(os.path.join(channel_dir, "*.json")))
+    if not files:
+        raise ValueError(f"No export files found in {channel_dir}")
+
+    top_level: Dict[str, Dict] = {}
+    reply_counts: Dict[str, int] = {}
+    bot_users = set()
+    has_replies = False
+    for file in files:
+        with open(file) as f:
+            messages = json.load(f)
+        if not isinstance(messages, list):
+            continue
+        for msg in messages:
+            if "ts" not in msg:
+                continue
+            thread_ts = msg.get("thread_ts")
+            is_reply = thread_ts and thread_ts != msg["ts"]
+            has_replies = has_replies or bool(is_reply)
+            if msg.get("bot_id") or msg.get("app_id"):
+                if msg.get("user"):
+                    bot_users.add(msg["user"])
+                continue
+            if msg.get("subtype"):
+                continue
+            if is_reply:
+                reply_counts[thread_ts] = reply_counts.get(thread_ts, 0) + 1
+            else:
+                top_level[msg["ts"]] = msg
+
+    ordered = sorted(top_level.values(), key=lambda msg: float(msg["ts"]))
+    texts = [msg.get("text", "") for msg in ordered]
+    timestamps = np.array([float(msg["ts"]) for msg in ordered], dtype=np.float64)
+    if has_replies:
+        answered = [reply_counts.get(msg["ts"], 0) > 0 for msg in ordered]
+    else:
+        # Exports without thread replies only list who replied. reply_count can't be used
+        # either way since it includes the bot's own reply to every question.
+        answered = [bool(set(msg.get("reply_users", [])) - bot_users) for msg in ordered]
+    return texts, timestamps, np.array(answered, dtype=bool)
+
+
+def load_index(path: str) -> Tuple[List[str], np.ndarray, np.ndarray, str]:
+    """Load a persisted vector store index, sorted by timestamp.
+
+    Returns:
+        (texts, timestamps, embeddings, model_name)
+    """
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    metadata = MessageMetadata.load(os.path.join(path, "messages"), mmap=True)
+    embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+    timestamps = np.asarray(metadata.timestamps(), dtype=np.float64)
+    order = np.argsort(timestamps, kind="stable")
+    texts = [metadata.text(int(i)) for i in order]
+    return texts, timestamps[order], np.asarray(embeddings[order], dtype=np.float32), meta["model_name"]
+
+
+def normalize_rows(embeddings: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length so dot products are cosine similarities."""
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (embeddings / norms).astype(np.float32, copy=False)
+
+
+def best_earlier_matches(embeddings: np.ndarray, query_block: int = 512,
+                         key_chunk: int = 32768) -> Tuple[np.ndarray, np.ndarray]:
+    """For every message find the most similar message posted before it.
+
+    Similarities are computed block by block with matrix products, so memory stays at
+    query_block x key_chunk scores regardless of the number of messages.
+
+    Args:
+        embeddings: Unit-length embeddings in chronological order
+
+    Returns:
+        (best_similarity, best_index) per message; -inf and -1 for the first message
+    """
+    n = len(embeddings)
+    best_similarity = np.full(n, -np.inf, dtype=np.float32)
+    best_index = np.full(n, -1, dtype=np.int64)
+    for query_start in range(0, n, query_block):
+        query_end = min(n, query_start + query_block)
+        queries = embeddings[query_start:query_end]
+        rows = np.arange(query_start, query_end)[:, None]
+        # Queries in this block can only match messages before the block's last query
+        for key_start in range(0, query_end - 1, key_chunk):
+            key_end = min(query_end - 1, key_start + key_chunk)
+            scores = queries @ embeddings[key_start:key_end].T
+            if key_end > query_start:
+                # Mask out the message itself and everything posted after it
+                scores[np.arange(key_start, key_end)[None, :] >= rows] = -np.inf
+            chunk_best = scores.argmax(axis=1)
+            chunk_similarity = scores[np.arange(len(scores)), chunk_best]
+            better = chunk_similarity > best_similarity[query_start:query_end]
+            best_similarity[query_start:query_end][better] = chunk_similarity[better]
+            best_index[query_start:query_end][better] = chunk_best[better] + key_start
+    return best_similarity, best_index
+
+
+def threshold_report(best_similarity: np.ndarray, best_index: np.ndarray,
+                     answered: Optional[np.ndarray], thresholds: Sequence[float]) -> List[Dict]:
+    """Hit rates and precision/recall proxies per similarity threshold.
+
+    A hit is a question whose best earlier match scores above the threshold, i.e. one the
+    bot would have replied to. With thread information, a hit counts as useful when the
+    matched thread has human replies. The precision proxy is useful hits / hits. The recall proxy
+    is useful hits / questions whose best earlier match has human replies.
+    """
+    questions = len(best_similarity)
+    matched_answered = None
+    if answered is not None:
+        matched_answered = np.zeros(questions, dtype=bool)
+        has_match = best_index >= 0
+        matched_answered[has_match] = answered[best_index[has_match]]
+
+    rows = []
+    for threshold in sorted(thresholds):
+        hit = best_similarity > threshold
+        hits = int(hit.sum())
+        row = {
+            "threshold": threshold,
+            "hits": hits,
+            "hit_rate": hits / questions if questions else 0.0,
+        }
+        if matched_answered is not None:
+            useful = int((hit & matched_answered).sum())
+            answerable = int(matched_answered.sum())
+            row["useful_hits"] = useful
+            row["precision_proxy"] = useful / hits if hits else 0.0
+            row["recall_proxy"] = useful / answerable if answerable else 0.0
+        rows.append(row)
+    return rows
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    values = np.array(samples) * 1000
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+    }
+
+
+def measure_live_latency(store, texts: List[str], samples: int, seed: int = 0) -> Dict[str, Dict[str, float]]:
+    """Time single questions through MessageVectorStore.find_similar_messages.
+
+    The store's query caches are disabled so every sample pays for encoding and the scan.
+
+    Args:
+        store: A MessageVectorStore holding the replayed embeddings
+        texts: Questions to sample from
+        samples: Number of questions to time
+    """
+    store.query_embedding_cache = LRUCache(0)
+    store.query_result_cache = LRUCache(0)
+
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(texts), size=min(samples, len(texts)), replace=False)
+    encode_times, search_times = [], []
+    for i in picks:
+        started = time.perf_counter()
+        store.model.encode([texts[int(i)]])
+        encode_times.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        store.find_similar_messages(texts[int(i)], threshold=1.0)
+        search_times.append(time.perf_counter() - started)
+    return {
+        "encode_query": _percentiles(encode_times),
+        "find_similar_messages": _percentiles(search_times),
+    }
+
+
+def print_report(report: Dict) -> None:
+    print(f"Questions replayed: {report['questions']}")
+    for stage, stats in report["stages"].items():
+        print(f"{stage}: " + ", ".join(f"{key}={value:.2f}" for key, value in stats.items()))
+    for stage, stats in report.get("live_latency", {}).items():
+        print(f"live {stage}: " + ", ".join(f"{key}={value:.2f}" for key, value in stats.items()))
+    print()
+
+    has_proxies = report["thresholds"] and "precision_proxy" in report["thresholds"][0]
+    header = f"{'threshold':>9}  {'hits':>8}  {'hit rate':>8}"
+    if has_proxies:
+        header += f"  {'useful':>8}  {'precision~':>10}  {'recall~':>8}"
+    print(header)
+    for row in report["thresholds"]:
+        line = f"{row['threshold']:>9.2f}  {row['hits']:>8}  {row['hit_rate']:>8.1%}"
+        if has_proxies:
+            line += (f"  {row['useful_hits']:>8}  {row['precision_proxy']:>10.1%}"
+                     f"  {row['recall_proxy']:>8.1%}")
+        print(line)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="deja-q-replay",
+        description="Replay historical questions through the search path and report hit rates and latency."
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--export", help="Slack export directory (export root with --channel, or a channel directory)")
+    source.add_argument("--index", help="Directory of a persisted vector store index")
+    parser.add_argument("--channel", help="Channel name inside the export root")
+    parser.add_argument("--model", help="Embedding model for --export (default: EMBEDDING_MODEL or all-MiniLM-L6-v2)")
+    parser.add_argument("--thresholds", default=",".join(str(t) for t in DEFAULT_THRESHOLDS),
+                        help="Comma-separated similarity thresholds to report")
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes for encoding")
+    parser.add_argument("--live-sample", type=int, default=200,
+                        help="Questions timed through find_similar_messages, 0 to skip")
+    parser.add_argument("--output", help="Also write the report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    thresholds = [float(t) for t in args.thresholds.split(",") if t]
+    stages: Dict[str, Dict[str, float]] = {}
+    store = None
+
+    started = time.perf_counter()
+    if args.export:
+        texts, timestamps, answered = load_export(args.export, args.channel)
+        model_name = args.model or os.getenv("EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL)
+        embeddings = None
+    else:
+        texts, timestamps, embeddings, model_name = load_index(args.index)
+        answered = None
+    stages["load"] = {"seconds": time.perf_counter() - started}
+    logging.info(f"Loaded {len(texts)} questions")
+    if not texts:
+        print("No questions to replay")
+        return 1
+
+    if embeddings is None or args.live_sample > 0:
+        # The store loads the model; nothing is sent to Slack
+        store = MessageVectorStore("replay", client=SlackClient(), model_name=model_name)
+
+    if embeddings is None:
+        # Encode the raw texts, like the live index and search do
+        encoder = BulkEncoder(store.model, num_workers=args.workers, model_name=model_name)
+        embeddings = encoder.encode_into(texts)
+        stages["encode"] = {
+            "seconds": encoder.last_stats["seconds"],
+            "messages_per_second": encoder.last_stats["messages_per_second"],
+        }
+
+    started = time.perf_counter()
+    best_similarity, best_index = best_earlier_matches(normalize_rows(np.asarray(embeddings, dtype=np.float32)))
+    elapsed = time.perf_counter() - started
+    stages["score"] = {
+        "seconds": elapsed,
+        "messages_per_second": len(texts) / elapsed if elapsed > 0 else 0.0,
+    }
+
+    report = {
+        "questions": len(texts),
+        "model_name": model_name,
+        "stages": stages,
+        "thresholds": threshold_report(best_similarity, best_index, answered, thresholds),
+    }
+    if store is not None and args.live_sample > 0:
+        store.messages = MessageMetadata(
+            {"text": text, "ts": f"{ts:.6f}"} for text, ts in zip(texts, timestamps)
+        )
+        store.embeddings = np.asarray(embeddings, dtype=np.float32)
+        report["live_latency"] = measure_live_latency(store, texts, args.live_sample)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+import logging
+import queue
+import threading
+import time
+from enum import IntEnum
+from typing import Any, Callable, Optional
+
+
+class DegradationLevel(IntEnum):
+    """How much of the message pipeline to run, from full service to a bare acknowledgement."""
+    FULL = 0          # Search, fetch the thread, summarize it and post the link
+    NO_SUMMARY = 1    # Search and fetch the thread, post the link without a summary
+    NO_THREAD = 2     # Search and post the link, skip the thread fetch entirely
+    ACK_ONLY = 3      # Skip the search and just acknowledge the question
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because its circuit breaker is open."""
+
+
+class RateLimitTimeout(Exception):
+    """Raised when a rate-limited call could not get a token within its time budget."""
+
+
+class Deadline:
+    def __init__(self, seconds: float, start: Optional[float] = None):
+        """A fixed point in time by which some work has to be finished.
+
+        Args:
+            seconds: Time budget in seconds
+            start: Optional monotonic start time, defaults to now
+        """
+        self.seconds = seconds
+        self.start = time.monotonic() if start is None else start
+        self.expires_at = self.start + seconds
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline, never negative."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def elapsed(self) -> float:
+        """Seconds since the deadline was started."""
+        return time.monotonic() - self.start
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0.0
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """Stop calling a dependency after repeated failures, then probe it again later.
+
+        Args:
+            name: Name of the protected dependency, used in logs
+            failure_threshold: Consecutive failures before the circuit opens
+            reset_timeout: Seconds to stay open before letting a single probe call through
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Return True if a call may be made right now."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            # Half-open: let exactly one probe through
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != self.CLOSED:
+                logging.info(f"Circuit breaker '{self.name}' closed")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logging.warning(
+                        f"Circuit breaker '{self.name}' opened after {self._failures} failures"
+                    )
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def call(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Call func through the breaker, raising CircuitOpenError if the circuit is open."""
+        if not self.allow():
+            raise CircuitOpenError(f"Circuit breaker '{self.name}' is open")
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+
+class AdmissionQueue:
+    def __init__(self, worker: Callable[[Any, float], None], max_size: int = 100, num_workers: int = 2):
+        """A bounded work queue that sheds new items instead of letting work pile up.
+
+        Args:
+            worker: Called as worker(item, enqueued_at) on a worker thread for each admitted item
+            max_size: Maximum number of items waiting to be processed
+            num_workers: Number of worker threads
+        """
+        self.worker = worker
+        self.max_size = max_size
+        self.num_workers = num_workers
+        self._queue: queue.Queue = queue.Queue(maxsize=max_size)
+        self._threads: list[threading.Thread] = []
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.shed = 0
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.num_workers):
+                thread = threading.Thread(target=self._run, name=f"deja-q-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self) -> None:
+        while True:
+            item, enqueued_at = self._queue.get()
+            try:
+                self.worker(item, enqueued_at)
+            except Exception as e:
+                logging.error(f"Error in admission queue worker: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def submit(self, item: Any) -> bool:
+        """Queue an item for processing.
+
+        Returns:
+            True if the item was admitted, False if it was shed because the queue is full
+        """
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((item, time.monotonic()))
+        except queue.Full:
+            self.shed += 1
+            logging.warning(f"Admission queue full ({self.max_size} pending) - shedding message")
+            return False
+        self.admitted += 1
+        return True
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def load(self) -> float:
+        """Fraction of the queue that is currently in use."""
+        return self.depth() / self.max_size if self.max_size else 0.0
+
+    def join(self) -> None:
+        """Block until every admitted item has been processed."""
+        self._queue.join()
+
+
+class Priority(IntEnum):
+    """Traffic lanes for rate-limited calls. Lower values are served first."""
+    LIVE = 0       # Replies to questions that were just asked
+    BACKFILL = 1   # History fetches and re-indexing
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float, burst: Optional[float] = None, backfill_reserve: float = 0.2):
+        """Token bucket rate limiter with a reserved share for live traffic.
+
+        Args:
+            per_minute: Sustained number of calls allowed per minute
+            burst: Bucket capacity, defaults to a few seconds worth of calls (at least 1)
+            backfill_reserve: Fraction of the capacity that backfill calls may not use
+        """
+        self.rate = per_minute / 60.0
+        self.capacity = burst if burst is not None else max(1.0, min(per_minute, self.rate * 5))
+        self.reserve = min(self.capacity * backfill_reserve, self.capacity - 1.0)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._live_waiting = 0
+        self._cond = threading.Condition()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def acquire(self, priority: Priority = Priority.LIVE, timeout: Optional[float] = None) -> float:
+        """Block until a call may be made.
+
+        Live calls are always served before waiting backfill calls, and backfill calls
+        leave a reserve of tokens untouched so a burst of live traffic is not starved.
+
+        Args:
+            priority: Lane of the call
+            timeout: Optional maximum number of seconds to wait
+
+        Returns:
+            Seconds spent waiting for a token
+
+        Raises:
+            RateLimitTimeout: If no token can be had within timeout seconds
+        """
+        start = time.monotonic()
+        give_up_at = None if timeout is None else start + timeout
+        needed = 1.0 if priority == Priority.LIVE else 1.0 + self.reserve
+        with self._cond:
+            if priority == Priority.LIVE:
+                self._live_waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    yielding = priority != Priority.LIVE and self._live_waiting > 0
+                    if now >= self._blocked_until and self._tokens >= needed and not yielding:
+                        self._tokens -= 1.0
+                        break
+                    wait = max(self._blocked_until - now, (needed - self._tokens) / self.rate, 0.01)
+                    if give_up_at is not None:
+                        # Fail now rather than wait for a token that comes too late
+                        if now + wait > give_up_at:
+                            raise RateLimitTimeout(f"No token within {timeout:.2f}s")
+                    self._cond.wait(wait)
+            finally:
+                if priority == Priority.LIVE:
+                    self._live_waiting -= 1
+                    self._cond.notify_all()
+        return time.monotonic() - start
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every caller for the given number of seconds (e.g. after a Retry-After)."""
+        with self._cond:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._tokens = 0.0
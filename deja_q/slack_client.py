@@ -0,0 +1,117 @@
+import functools
+import logging
+import threading
+from collections import Counter
+from typing import Any, Dict, Optional
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
+from .profiling import tracer
+from .resilience import Deadline, Priority, RateLimitTimeout, TokenBucket
+
+class SlackClient:
+    # Calls per minute for each Web API method, following Slack's rate limit tiers
+    METHOD_LIMITS = {
+        "conversations_list": 20,       # Tier 2
+        "conversations_history": 50,    # Tier 3
+        "conversations_info": 50,       # Tier 3
+        "conversations_replies": 50,    # Tier 3
+        "chat_getPermalink": 100,       # Tier 4
+        "chat_postMessage": 60,         # Special tier: about one message per second
+    }
+    DEFAULT_LIMIT = 20
+
+    def __init__(self, token: Optional[str] = None, timeout: int = 30, max_retries: int = 2,
+                 client: Optional[WebClient] = None):
+        """Initialize a rate-limit-aware wrapper around the Slack WebClient.
+
+        Every Web API method gets its own token bucket. Methods are called the same way
+        as on WebClient, with an optional priority keyword, e.g.
+        client.chat_postMessage(channel=..., text=..., priority=Priority.LIVE).
+        
+        Args:
+            token: Slack bot token
+            timeout: Request timeout in seconds
+            max_retries: Number of times a call is retried after Slack responds with 429
+            client: Optional WebClient to wrap instead of creating one
+        """
+        self.client = client or WebClient(token=token, timeout=timeout)
+        self.max_retries = max_retries
+        self.buckets: Dict[str, TokenBucket] = {}
+        self._buckets_lock = threading.Lock()
+        self._stats: Dict[str, Counter] = {
+            "calls": Counter(),
+            "throttled": Counter(),
+            "rate_limited": Counter(),
+        }
+        self._stats_lock = threading.Lock()
+
+    def _bucket(self, method: str) -> TokenBucket:
+        with self._buckets_lock:
+            if method not in self.buckets:
+                self.buckets[method] = TokenBucket(self.METHOD_LIMITS.get(method, self.DEFAULT_LIMIT))
+            return self.buckets[method]
+
+    def _count(self, stat: str, method: str) -> None:
+        with self._stats_lock:
+            self._stats[stat][method] += 1
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Per-method counts of calls, locally throttled calls and calls rejected by Slack with 429."""
+        with self._stats_lock:
+            return {name: dict(counter) for name, counter in self._stats.items()}
+
+    def call(self, method: str, priority: Priority = Priority.LIVE, deadline: Optional[Deadline] = None,
+             **kwargs) -> Any:
+        """Call a Web API method once its token bucket allows it, retrying on 429 responses.
+        
+        Args:
+            method: Name of the WebClient method, e.g. "chat_postMessage"
+            priority: Lane for the call; live calls preempt waiting backfill calls
+            deadline: Optional deadline bounding the time spent waiting for tokens, retries included
+            **kwargs: Arguments for the API method
+            
+        Returns:
+            The SlackResponse from the API method
+
+        Raises:
+            RateLimitTimeout: If the rate limits would hold the call past its deadline
+        """
+        with tracer.span(f"slack.{method}"):
+            return self._call(method, priority, deadline, kwargs)
+
+    def _call(self, method: str, priority: Priority, deadline: Optional[Deadline], kwargs: Dict[str, Any]) -> Any:
+        bucket = self._bucket(method)
+        for attempt in range(self.max_retries + 1):
+            try:
+                waited = bucket.acquire(priority, timeout=deadline.remaining() if deadline else None)
+            except RateLimitTimeout:
+                self._count("throttled", method)
+                logging.warning(f"Giving up on {method}, rate limits would exceed its deadline ({priority.name})")
+                raise
+            if waited > 0.01:
+                self._count("throttled", method)
+                logging.info(f"Throttled {method} for {waited:.2f}s ({priority.name})")
+            self._count("calls", method)
+            try:
+                return getattr(self.client, method)(**kwargs)
+            except SlackApiError as e:
+                if e.response is None or e.response.status_code != 429:
+                    raise
+                self._count("rate_limited", method)
+                headers = e.response.headers or {}
+                retry_after = float(headers.get("Retry-After", headers.get("retry-after", 1)))
+                logging.warning(
+                    f"Slack rate limited {method}, retrying in {retry_after}s "
+                    f"(attempt {attempt + 1}/{self.max_retries + 1})"
+                )
+                bucket.pause(retry_after)
+                if attempt == self.max_retries:
+                    raise
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "client":
+            raise AttributeError(name)
+        attr = getattr(self.client, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+        return functools.partial(self.call, name)
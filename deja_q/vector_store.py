@@ -1,27 +1,110 @@
 import os
+import json
 import logging
-from typing import List, Dict
-from slack_sdk import WebClient
+import re
+import threading
+from typing import Iterable, List, Dict, Optional, Tuple, Union
 from sentence_transformers import SentenceTransformer
 import numpy as np
 from dotenv import load_dotenv
+from .cache import LRUCache
+from .encoder import BulkEncoder
+from .metadata import AppendableRows, MessageMetadata
+from .profiling import tracer
+from .resilience import Deadline, Priority
+from .slack_client import SlackClient
 
 # Load environment variables
 load_dotenv()
 
+DEFAULT_EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+INDEX_FORMAT_VERSION = 2
+
+
+def _slice_segments(segments: List[np.ndarray], start: int) -> List[np.ndarray]:
+    """The rows from start onwards of consecutive row segments."""
+    sliced = []
+    for segment in segments:
+        if start < len(segment):
+            sliced.append(segment[start:])
+        start = max(0, start - len(segment))
+    return sliced
+
 class MessageVectorStore:
-    def __init__(self, channel_name: str):
+    def __init__(self, channel_name: str, client: Optional[SlackClient] = None,
+                 model_name: Optional[str] = None, index_dir: Optional[str] = None):
         self.channel_name = channel_name
-        self.client = WebClient(token=os.getenv("SLACK_BOT_TOKEN"))
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.messages: List[Dict] = []
+        self.client = client or SlackClient(token=os.getenv("SLACK_BOT_TOKEN"))
+        self.model_name = model_name or os.getenv("EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL)
+        self.model = SentenceTransformer(self.model_name)
+        self.encode_workers = int(os.getenv("ENCODE_WORKERS", "0"))
+        # Directory holding one persisted index per embedding model, persistence is off if unset
+        self.index_dir = index_dir or os.getenv("INDEX_DIR")
+        self.mmap_index = os.getenv("INDEX_MMAP", "").lower() in ("1", "true", "yes")
+        self._messages = MessageMetadata()
+        # Guards model, messages and embeddings so a re-index can swap them atomically
+        self._lock = threading.RLock()
+
+        # Repeated questions skip the model (embedding cache) and the scan (result cache).
+        # Cached results remember how many rows they cover, so after new messages are
+        # appended only those rows are scored.
+        cache_size = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+        self.query_embedding_cache = LRUCache(cache_size)
+        self.query_result_cache = LRUCache(cache_size)
+        self.partial_result_hits = 0
+        # Incremented whenever the embeddings are replaced, so cached search results can be invalidated
+        self.generation = 0
         self.embeddings = None
 
+    @property
+    def embeddings(self) -> Optional[np.ndarray]:
+        """Embedding matrix, row i belonging to messages[i].
+
+        Rows added since the embeddings were last replaced are kept apart from the (possibly
+        memory-mapped) loaded rows, reading this property joins them into a copy.
+        """
+        if self._embedding_rows is None:
+            return None
+        return self._embedding_rows.to_array()
+
+    @embeddings.setter
+    def embeddings(self, embeddings: Optional[np.ndarray]) -> None:
+        """Replace the embeddings, invalidating cached search results.
+
+        Rows for new messages are added with _append_embeddings, which keeps them valid.
+        """
+        self._embedding_rows = None if embeddings is None else AppendableRows(embeddings)
+        self.generation += 1
+        self.query_result_cache.clear()
+
+    def _append_embeddings(self, embeddings: np.ndarray) -> None:
+        """Add rows for newly appended messages, the caller holds the lock."""
+        if self._embedding_rows is None:
+            self.embeddings = embeddings
+        else:
+            # Appending keeps cached results valid for the rows they cover
+            self._embedding_rows.append(embeddings)
+
+    @property
+    def messages(self) -> MessageMetadata:
+        """Columnar metadata of all indexed messages, row i matching embeddings[i]."""
+        return self._messages
+
+    @messages.setter
+    def messages(self, messages: Union[MessageMetadata, Iterable[Dict]]) -> None:
+        if not isinstance(messages, MessageMetadata):
+            messages = MessageMetadata(messages)
+        self._messages = messages
+
     def fetch_channel_history(self) -> None:
         """Fetch all messages from the specified channel."""
+        self.messages = self._fetch_messages()
+
+    def _fetch_messages(self, oldest: Optional[str] = None) -> List[Dict]:
+        """Fetch messages from the channel, optionally only those newer than oldest."""
         try:
             # First get the channel ID
-            channel_info = self.client.conversations_list()
+            channel_info = self.client.conversations_list(priority=Priority.BACKFILL)
             channel_id = None
             for channel in channel_info["channels"]:
                 if channel["name"] == self.channel_name:
@@ -32,12 +115,17 @@ class MessageVectorStore:
                 raise ValueError(f"Channel {self.channel_name} not found")
 
             # Fetch channel history
-            result = self.client.conversations_history(channel=channel_id)
-            self.messages = [
+            history_args = {"oldest": oldest} if oldest else {}
+            result = self.client.conversations_history(
+                channel=channel_id,
+                priority=Priority.BACKFILL,
+                **history_args
+            )
+            return [
                 {
                     "text": msg["text"],
                     "ts": msg["ts"],
-                    "permalink": self._get_permalink(channel_id, msg["ts"]),
+                    "permalink": self._get_permalink(channel_id, msg["ts"], priority=Priority.BACKFILL),
                     "user": msg.get("user")
                 }
                 for msg in result["messages"]
@@ -48,12 +136,13 @@ class MessageVectorStore:
             logging.error(f"Error fetching channel history: {str(e)}")
             raise
 
-    def _get_permalink(self, channel_id: str, message_ts: str) -> str:
+    def _get_permalink(self, channel_id: str, message_ts: str, priority: Priority = Priority.LIVE) -> str:
         """Get permalink for a message."""
         try:
             result = self.client.chat_getPermalink(
                 channel=channel_id,
-                message_ts=message_ts
+                message_ts=message_ts,
+                priority=priority
             )
             return result["permalink"]
         except Exception as e:
@@ -67,87 +156,309 @@ class MessageVectorStore:
             return
 
         try:
-            texts = [msg["text"] for msg in self.messages]
-            embeddings = self.model.encode(texts)
-            self.embeddings = np.array(embeddings)
+            texts = self.messages.texts()
+            encoder = BulkEncoder(self.model, num_workers=self.encode_workers, model_name=self.model_name)
+            self.embeddings = encoder.encode_into(texts)
             logging.info(f"Created embeddings with shape {self.embeddings.shape}")
         except Exception as e:
             logging.error(f"Error creating embeddings: {str(e)}")
             raise
 
-    def add_message(self, message: dict, channel_id: str) -> None:
-        """Add a new message to the vector store and update embeddings."""
+    def add_message(self, message: dict, channel_id: str, priority: Priority = Priority.LIVE) -> None:
+        """Add a new message to the vector store and update embeddings.
+
+        Args:
+            message: Slack message with text, ts and user
+            channel_id: Channel the message was posted in
+            priority: Lane for the permalink lookup, BACKFILL for messages indexed late
+        """
+        with tracer.span("vector_store.add_message"):
+            self._add_message(message, channel_id, priority)
+
+    def _add_message(self, message: dict, channel_id: str, priority: Priority) -> None:
         try:
             # Create message object
             message_obj = {
                 "text": message["text"],
                 "ts": message["ts"],
-                "permalink": self._get_permalink(channel_id, message["ts"]),
+                "permalink": self._get_permalink(channel_id, message["ts"], priority=priority),
                 "user": message.get("user")
             }
             
-            # Add to messages list
-            self.messages.append(message_obj)
-            
-            # Create embedding for new message
-            new_embedding = self.model.encode([message["text"]])[0]
-            
-            # Update embeddings array
-            if self.embeddings is None:
-                self.embeddings = np.array([new_embedding])
-            else:
-                self.embeddings = np.vstack([self.embeddings, new_embedding])
+            # Create embedding for new message, outside the lock so searches aren't blocked.
+            # If a re-index swaps the model meanwhile, encode again with the new model.
+            while True:
+                with self._lock:
+                    model, model_name = self.model, self.model_name
+                new_embedding = model.encode([message["text"]])[0]
+                with self._lock:
+                    if self.model_name != model_name:
+                        continue
+                    # Add to messages list and update embeddings array
+                    self.messages.append(message_obj)
+                    self._append_embeddings(np.array([new_embedding]))
+                    break
             
             logging.info(f"Added new message to vector store. Total messages: {len(self.messages)}")
         except Exception as e:
             logging.error(f"Error adding message to vector store: {str(e)}")
             raise
 
-    def find_similar_messages(self, query: str, threshold: float = 0.8) -> List[Dict]:
+    def find_similar_messages(self, query: str, threshold: float = 0.8, limit: Optional[int] = None) -> List[Dict]:
         """
         Find messages similar to the query.
-        Returns list of messages with similarity score above threshold.
+        Returns list of messages with similarity score above threshold, most similar first,
+        at most limit of them if given.
         """
-        if self.embeddings is None:
+        if self._embedding_rows is None:
             raise ValueError("No embeddings available. Run create_embeddings first.")
 
+        with tracer.span("vector_store.find_similar_messages"):
+            return self._find_similar_messages(query, threshold, limit)
+
+    def _find_similar_messages(self, query: str, threshold: float, limit: Optional[int]) -> List[Dict]:
+        # Take a consistent snapshot, a re-index may swap the model and embeddings at any time
+        with self._lock:
+            model, model_name, messages, generation = self.model, self.model_name, self.messages, self.generation
+            rows = self._embedding_rows
+            count = len(rows)
+            segments = rows.segments()
+
         try:
-            query_embedding = self.model.encode([query])[0]
-            query_embedding = np.array(query_embedding)
-            
-            # Calculate cosine similarity
-            norm_embeddings = np.linalg.norm(self.embeddings, axis=1)
-            norm_query = np.linalg.norm(query_embedding)
-            similarities = np.dot(self.embeddings, query_embedding) / (norm_embeddings * norm_query)
-
-            # Get similar messages above threshold
-            similar_messages = []
-            for i, similarity in enumerate(similarities):
-                if similarity > threshold:
-                    similar_messages.append({
-                        **self.messages[i],
-                        "similarity": float(similarity)
-                    })
-
-            return sorted(similar_messages, key=lambda x: x["similarity"], reverse=True)
+            # The normalized query is only a cache key, the model sees the original text
+            normalized = self._normalize_query(query, lowercase=self._lowercases(model))
+            result_key = (model_name, normalized, threshold, limit)
+            cached = self.query_result_cache.get(
+                result_key, valid=lambda entry: entry[0] == generation and entry[1] <= count
+            )
+            if cached is not None and cached[1] == count:
+                hits = cached[2]
+            else:
+                embedding_key = (model_name, normalized)
+                query_embedding = self.query_embedding_cache.get(embedding_key)
+                if query_embedding is None:
+                    with tracer.span("encode_query"):
+                        query_embedding = np.array(model.encode([query])[0])
+                    self.query_embedding_cache.put(embedding_key, query_embedding)
+
+                if cached is None:
+                    with tracer.span("scan"):
+                        hits = self._rank_segments(segments, 0, query_embedding, threshold, limit)
+                else:
+                    # Only messages added since the result was cached need scoring, the best
+                    # of all rows are among the cached hits and the new rows' hits
+                    self.partial_result_hits += 1
+                    with tracer.span("scan_new_rows"):
+                        new_hits = self._rank_segments(_slice_segments(segments, cached[1]), cached[1],
+                                                       query_embedding, threshold, limit)
+                    hits = sorted(cached[2] + new_hits, key=lambda hit: -hit[1])[:limit]
+                self.query_result_cache.put(result_key, (generation, count, hits))
+
+            # Only build result dicts for the returned messages
+            return [{**messages[i], "similarity": similarity} for i, similarity in hits]
         except Exception as e:
             logging.error(f"Error finding similar messages: {str(e)}")
             raise
 
+    @classmethod
+    def _rank_segments(cls, segments: List[np.ndarray], offset: int, query_embedding: np.ndarray,
+                       threshold: float, limit: Optional[int]) -> List[Tuple[int, float]]:
+        """Rank consecutive row segments, the first starting at row offset."""
+        hits = []
+        for segment in segments:
+            if len(segment):
+                hits.extend(cls._rank(segment, query_embedding, threshold, limit, offset=offset))
+            offset += len(segment)
+        if len(segments) > 1:
+            hits = sorted(hits, key=lambda hit: -hit[1])[:limit]
+        return hits
+
+    @staticmethod
+    def _rank(embeddings: np.ndarray, query_embedding: np.ndarray, threshold: float,
+              limit: Optional[int], offset: int = 0) -> List[Tuple[int, float]]:
+        """(index, similarity) of rows above threshold, most similar first, at most limit of them."""
+        # Calculate cosine similarity
+        norm_embeddings = np.linalg.norm(embeddings, axis=1)
+        norm_query = np.linalg.norm(query_embedding)
+        similarities = np.dot(embeddings, query_embedding) / (norm_embeddings * norm_query)
+
+        # Rank the messages above threshold
+        indices = np.flatnonzero(similarities > threshold)
+        if limit is not None and limit < len(indices):
+            indices = indices[np.argpartition(-similarities[indices], limit - 1)[:limit]]
+        indices = indices[np.argsort(-similarities[indices], kind="stable")]
+        return [(int(i) + offset, float(similarities[i])) for i in indices]
+
+    @staticmethod
+    def _lowercases(model: SentenceTransformer) -> bool:
+        """Whether the model's tokenizer lowercases its input, making case irrelevant."""
+        return bool(getattr(getattr(model, "tokenizer", None), "do_lower_case", False))
+
+    @staticmethod
+    def _normalize_query(query: str, lowercase: bool = False) -> str:
+        """Collapse whitespace, and case if the model ignores it, so equivalent queries share cache entries."""
+        normalized = " ".join(query.split())
+        return normalized.lower() if lowercase else normalized
+
+    def query_cache_stats(self) -> Dict[str, Dict[str, float]]:
+        """Hit and miss counts of the query embedding and result caches.
+
+        Result hits include partial hits, where messages added since the result was cached
+        still had to be scored.
+        """
+        results = self.query_result_cache.stats()
+        results["partial_hits"] = self.partial_result_hits
+        return {
+            "embeddings": self.query_embedding_cache.stats(),
+            "results": results,
+        }
+
     def initialize(self) -> None:
-        """Initialize the vector store by fetching messages and creating embeddings."""
+        """Initialize the vector store by fetching messages and creating embeddings.
+
+        If a persisted index for the current model exists it is loaded instead, and only
+        messages posted since it was saved are fetched and encoded.
+        """
         logging.info("Initializing vector store...")
-        self.fetch_channel_history()
-        logging.info(f"Fetched {len(self.messages)} messages")
-        self.create_embeddings()
-        logging.info("Created embeddings for all messages")
+        if self.load_index():
+            logging.info(f"Loaded {len(self.messages)} messages from persisted index")
+            if self._catch_up():
+                self.save_index()
+        else:
+            self.fetch_channel_history()
+            logging.info(f"Fetched {len(self.messages)} messages")
+            self.create_embeddings()
+            logging.info("Created embeddings for all messages")
+            self.save_index()
+
+    def _catch_up(self) -> int:
+        """Fetch and encode messages posted after the newest message in the index.
+
+        Returns:
+            Number of messages added
+        """
+        new_messages = self._fetch_messages(oldest=self.messages.latest_ts())
+        if not new_messages:
+            return 0
+        encoder = BulkEncoder(self.model, num_workers=self.encode_workers, model_name=self.model_name)
+        new_embeddings = encoder.encode_into([msg["text"] for msg in new_messages])
+        with self._lock:
+            self.messages.extend(new_messages)
+            self._append_embeddings(new_embeddings)
+        logging.info(f"Added {len(new_messages)} messages posted since the index was saved")
+        return len(new_messages)
+
+    def index_path(self, model_name: Optional[str] = None) -> Optional[str]:
+        """Directory of the persisted index for a model, or None if persistence is disabled."""
+        if not self.index_dir:
+            return None
+        model_id = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name or self.model_name)
+        return os.path.join(self.index_dir, self.channel_name, model_id)
+
+    def save_index(self) -> None:
+        """Persist messages and embeddings under a directory keyed by the embedding model."""
+        # Messages and embeddings are only appended to, so the first count rows can be
+        # written without holding the lock
+        with self._lock:
+            model_name, messages, rows = self.model_name, self.messages, self._embedding_rows
+            count = len(messages)
+        path = self.index_path(model_name)
+        if not path or rows is None:
+            return
+        try:
+            os.makedirs(path, exist_ok=True)
+            meta_file = os.path.join(path, "meta.json")
+            # Invalidate the old index first, then write data files, then the metadata
+            # that marks the index as complete
+            if os.path.exists(meta_file):
+                os.remove(meta_file)
+            messages.save(os.path.join(path, "messages"), count)
+            rows.save(os.path.join(path, "embeddings.npy"), count)
+            meta = {
+                "version": INDEX_FORMAT_VERSION,
+                "model_name": model_name,
+                "count": count,
+                "dim": int(rows.shape[1]),
+            }
+            with open(meta_file + ".tmp", "w") as f:
+                json.dump(meta, f)
+            os.replace(meta_file + ".tmp", meta_file)
+            logging.info(f"Saved index for model {model_name} to {path}")
+        except Exception as e:
+            logging.error(f"Error saving index: {str(e)}")
+
+    def load_index(self, model_name: Optional[str] = None, model: Optional[SentenceTransformer] = None) -> bool:
+        """Load the persisted index for the current model, or switch to the index of another model.
+
+        Args:
+            model_name: Optional other model whose saved index should be loaded
+            model: The loaded model for model_name, required when switching models
+
+        Returns:
+            True if an index built with the model was loaded
+        """
+        model_name = model_name or self.model_name
+        if model_name != self.model_name and model is None:
+            raise ValueError("A model is needed to switch to another model's index")
+        path = self.index_path(model_name)
+        if not path or not os.path.exists(os.path.join(path, "meta.json")):
+            return False
+        try:
+            with open(os.path.join(path, "meta.json")) as f:
+                meta = json.load(f)
+            if meta.get("version") != INDEX_FORMAT_VERSION or meta.get("model_name") != model_name:
+                logging.warning(f"Ignoring index at {path}: built for {meta.get('model_name')}, not {model_name}")
+                return False
+            mmap_mode = "r" if self.mmap_index else None
+            embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode=mmap_mode)
+            messages = MessageMetadata.load(os.path.join(path, "messages"), mmap=self.mmap_index)
+            if len(messages) != meta["count"] or embeddings.shape != (meta["count"], meta["dim"]):
+                logging.warning(f"Ignoring incomplete index at {path}")
+                return False
+        except Exception as e:
+            logging.error(f"Error loading index: {str(e)}")
+            return False
+        with self._lock:
+            if model_name != self.model_name:
+                self.model_name = model_name
+                self.model = model
+                self.query_embedding_cache.clear()
+            self.messages = messages
+            self.embeddings = embeddings
+        return True
+
+    def swap_model(self, model_name: str, model: SentenceTransformer, embeddings: np.ndarray, count: int) -> None:
+        """Atomically switch to a new embedding model and its embeddings.
+
+        Args:
+            model_name: Name of the new model
+            model: The new model
+            embeddings: Embeddings of the first count messages, made with the new model
+            count: Number of messages covered by embeddings; messages added since are encoded now
+        """
+        while True:
+            with self._lock:
+                total = len(self.messages)
+                if total == count:
+                    self.model_name = model_name
+                    self.model = model
+                    self.embeddings = embeddings
+                    self.query_embedding_cache.clear()
+                    break
+                new_texts = self.messages.texts(count, total)
+            # Encode messages added during the job without holding the lock, then check again
+            embeddings = np.vstack([embeddings, model.encode(new_texts)])
+            count = total
+        logging.info(f"Switched to embedding model {model_name} ({len(embeddings)} messages)")
+        self.save_index()
 
-    def get_thread_messages(self, channel_id: str, thread_ts: str) -> list[str]:
+    def get_thread_messages(self, channel_id: str, thread_ts: str, deadline: Optional[Deadline] = None) -> list[str]:
         """Fetch all messages in a thread.
         
         Args:
             channel_id: The channel ID
             thread_ts: The timestamp of the parent message
+            deadline: Optional deadline bounding the wait for Slack's rate limits
             
         Returns:
             List of message texts in the thread
@@ -156,7 +467,8 @@ class MessageVectorStore:
             # Get replies in the thread
             result = self.client.conversations_replies(
                 channel=channel_id,
-                ts=thread_ts
+                ts=thread_ts,
+                deadline=deadline
             )
             
             # Extract message texts, excluding bot messages
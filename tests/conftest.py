@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+import deja_q.vector_store as vector_store_module
+
+class FakeTokenizer:
+    def __init__(self, do_lower_case):
+        self.do_lower_case = do_lower_case
+
+    def __call__(self, texts, **kwargs):
+        return {"input_ids": [[0] * (len(text.split()) + 2) for text in texts]}
+
+class FakeSentenceTransformer:
+    """Embeds a text as a bag of the first letters of its words and counts encode calls.
+
+    The dimension depends on the model name. Like most sentence transformers the fake
+    lowercases its input unless created with lowercase=False.
+    """
+    DIMS = {"small-model": 4, "large-model": 8}
+
+    def __init__(self, model_name, lowercase=True):
+        self.model_name = model_name
+        self.dim = self.DIMS.get(model_name, 26)
+        self.tokenizer = FakeTokenizer(lowercase)
+        self.calls = 0
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, show_progress_bar=False):
+        self.calls += 1
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            if self.tokenizer.do_lower_case:
+                text = text.lower()
+            for word in text.split():
+                embeddings[i, ord(word[0]) % self.dim] += 1
+        return embeddings
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    """Make vector stores load FakeSentenceTransformer; returns the class."""
+    monkeypatch.setattr(vector_store_module, "SentenceTransformer", FakeSentenceTransformer)
+    return FakeSentenceTransformer
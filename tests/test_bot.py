@@ -0,0 +1,20 @@
+import runpy
+from unittest.mock import Mock
+import deja_q.message_handler
+import deja_q.slack_client
+import deja_q.vector_store
+
+class TestBotModule:
+    def test_spawned_worker_does_not_start_bot(self, monkeypatch):
+        """Test that a spawned encoder worker importing the main module does not start a bot.
+
+        Spawned processes run the parent's main module with runpy under the name __mp_main__.
+        """
+        store = Mock()
+        monkeypatch.setattr(deja_q.vector_store, "MessageVectorStore", store)
+        monkeypatch.setattr(deja_q.slack_client, "SlackClient", Mock())
+        monkeypatch.setattr(deja_q.message_handler, "MessageHandler", Mock())
+        namespace = runpy.run_module("deja_q.bot", run_name="__mp_main__", alter_sys=True)
+        assert "create_app" in namespace
+        assert "app" not in namespace
+        store.assert_not_called()
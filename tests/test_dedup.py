@@ -0,0 +1,60 @@
+import time
+from deja_q.dedup import DedupCache, SQLiteDedupStore, event_keys
+
+class TestEventKeys:
+    def test_all_identifiers(self):
+        event_data = {
+            "event_id": "Ev1",
+            "event": {"client_msg_id": "abc", "channel": "C1", "ts": "1.000001"}
+        }
+        assert event_keys(event_data) == ["event:Ev1", "msg:abc", "ts:C1:1.000001"]
+
+    def test_missing_identifiers(self):
+        assert event_keys({"event": {}}) == []
+
+class TestDedupCache:
+    def test_detects_duplicates_by_any_key(self):
+        cache = DedupCache()
+        assert not cache.check_and_mark(["event:Ev1", "msg:abc"])
+        assert cache.check_and_mark(["event:Ev1"])
+        # A redelivery in a new event still shares the message id
+        assert cache.check_and_mark(["event:Ev2", "msg:abc"])
+
+    def test_evicts_oldest_when_full(self):
+        """Test that the oldest keys are evicted first, never recent ones."""
+        cache = DedupCache(max_size=3)
+        for key in ["a", "b", "c", "d"]:
+            cache.check_and_mark([key])
+        assert len(cache) == 3
+        assert cache.check_and_mark(["d"])
+        assert cache.check_and_mark(["c"])
+        assert not cache.check_and_mark(["a"])
+
+    def test_keys_expire(self):
+        cache = DedupCache(ttl=0.01)
+        cache.check_and_mark(["a"])
+        time.sleep(0.02)
+        assert not cache.check_and_mark(["a"])
+
+class TestSQLiteDedupStore:
+    def test_shared_between_instances(self, tmp_path):
+        """Test that a second store on the same file (e.g. after a restart) sees earlier events."""
+        path = str(tmp_path / "dedup.db")
+        first = SQLiteDedupStore(path)
+        assert not first.check_and_mark(["event:Ev1", "msg:abc"])
+        assert first.check_and_mark(["event:Ev1"])
+
+        second = SQLiteDedupStore(path)
+        assert second.check_and_mark(["msg:abc"])
+        assert not second.check_and_mark(["event:Ev2"])
+        first.close()
+        second.close()
+
+    def test_keys_expire_and_are_purged(self, tmp_path):
+        store = SQLiteDedupStore(str(tmp_path / "dedup.db"), ttl=0.01, purge_every=1)
+        store.check_and_mark(["a"])
+        time.sleep(0.02)
+        assert not store.check_and_mark(["b"])
+        assert len(store) == 1
+        assert not store.check_and_mark(["a"])
+        store.close()
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from deja_q.encoder import BulkEncoder
+
+class FakeModel:
+    """Stand-in for SentenceTransformer that embeds a text as [word count, length, 1]."""
+    max_seq_length = 128
+
+    def __init__(self):
+        self.batches = []
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, show_progress_bar=False):
+        self.batches.append(list(texts))
+        return np.array([[len(t.split()), len(t), 1.0] for t in texts], dtype=np.float32)
+
+class TestBulkEncoder:
+    @pytest.fixture
+    def texts(self):
+        return [
+            "short",
+            " ".join(["long"] * 60),
+            "another short one",
+            " ".join(["medium"] * 20),
+            "tiny",
+        ]
+
+    def test_results_in_input_order(self, texts):
+        """Test that embeddings come back in input order despite length sorting."""
+        encoder = BulkEncoder(FakeModel(), token_budget=64)
+        embeddings = encoder.encode_into(texts)
+        assert embeddings.shape == (len(texts), 3)
+        assert [int(e[0]) for e in embeddings] == [len(t.split()) for t in texts]
+
+    def test_batches_respect_token_budget(self, texts):
+        """Test that batches group similar lengths and stay within the token budget."""
+        model = FakeModel()
+        encoder = BulkEncoder(model, token_budget=64)
+        encoder.encode_into(texts)
+        for batch in model.batches:
+            longest = max(len(t.split()) + 2 for t in batch)
+            assert len(batch) == 1 or len(batch) * longest <= 64
+        # The short texts are encoded together, the long one on its own
+        assert sorted(model.batches[0]) == sorted(["short", "tiny", "another short one"])
+        assert model.batches[-1] == [texts[1]]
+
+    def test_reports_throughput(self, texts):
+        encoder = BulkEncoder(FakeModel())
+        encoder.encode_into(texts)
+        assert encoder.last_stats["messages"] == len(texts)
+        assert encoder.last_stats["messages_per_second"] > 0
+
+    def test_pool_requires_model_name(self):
+        with pytest.raises(ValueError):
+            BulkEncoder(FakeModel(), num_workers=2)
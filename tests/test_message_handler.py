@@ -0,0 +1,187 @@
+import time
+import pytest
+from unittest.mock import Mock
+from deja_q.message_handler import MessageHandler
+from deja_q.resilience import Deadline, Priority, RateLimitTimeout
+
+class TestMessageHandler:
+    @pytest.fixture
+    def vector_store(self):
+        store = Mock()
+        store.channel_name = "prototype"
+        store.find_similar_messages.return_value = [
+            {"text": "How do I get VPN access?", "ts": "1.000001",
+             "permalink": "https://slack.com/1", "similarity": 0.9}
+        ]
+        store.get_thread_messages.return_value = [
+            "How do I get VPN access?",
+            "File a ticket with IT"
+        ]
+        return store
+
+    @pytest.fixture
+    def handler(self, vector_store):
+        handler = MessageHandler(vector_store)
+        handler.client = Mock()
+        handler.ollama.summarize_thread = Mock(return_value="File a ticket with IT")
+        return handler
+
+    @pytest.fixture
+    def message(self):
+        return {"text": "How can I get VPN access?", "ts": "2.000001", "user": "U1", "channel": "C1"}
+
+    def posted_text(self, handler):
+        return handler.client.chat_postMessage.call_args[1]["text"]
+
+    def test_full_pipeline(self, handler, message):
+        handler._process_message(message, "C1")
+        assert "summary of the previous answer" in self.posted_text(handler)
+        handler.vector_store.add_message.assert_called_once_with(message, "C1")
+
+    def test_ollama_failure_degrades_to_link(self, handler, message):
+        """Test that an Ollama failure posts the link instead of an error."""
+        handler.ollama.summarize_thread.side_effect = TimeoutError("slow")
+        handler._process_message(message, "C1")
+        text = self.posted_text(handler)
+        assert "https://slack.com/1" in text
+        assert "1 replies" in text
+        assert "error" not in text
+
+    def test_open_breaker_skips_summary(self, handler, message):
+        for _ in range(handler.ollama.breaker.failure_threshold):
+            handler.ollama.breaker.record_failure()
+        handler._process_message(message, "C1")
+        handler.ollama.summarize_thread.assert_not_called()
+        assert "https://slack.com/1" in self.posted_text(handler)
+
+    def test_low_time_budget_skips_thread_fetch(self, handler, message):
+        handler._process_message(message, "C1", Deadline(handler.slack_timeout - 1))
+        handler.vector_store.get_thread_messages.assert_not_called()
+        assert "https://slack.com/1" in self.posted_text(handler)
+
+    def test_rate_limited_thread_fetch_posts_link(self, handler, message):
+        """Test that a thread fetch held back past the deadline degrades to the link."""
+        handler.vector_store.get_thread_messages.side_effect = RateLimitTimeout("No token within 5.00s")
+        handler._process_message(message, "C1")
+        text = self.posted_text(handler)
+        assert "https://slack.com/1" in text
+        assert "error" not in text
+        handler.ollama.summarize_thread.assert_not_called()
+
+    def test_expired_deadline_acknowledges_only(self, handler, message):
+        handler._process_message(message, "C1", Deadline(0))
+        handler.vector_store.find_similar_messages.assert_not_called()
+        assert "couldn't look for similar questions" in self.posted_text(handler)
+        self.wait_for_deferred(handler)
+        handler.vector_store.add_message.assert_called_once_with(message, "C1", priority=Priority.BACKFILL)
+
+    def wait_for_deferred(self, handler):
+        for _ in range(200):
+            if handler.vector_store.add_message.called:
+                return
+            time.sleep(0.01)
+
+    def test_expired_message_dropped_before_slack_calls(self, handler, message):
+        """Test that a message whose deadline passed while queued makes no live Slack calls."""
+        handler._defer_indexing = Mock()
+        handler._handle_admitted(message, time.monotonic() - handler.request_timeout - 1)
+        handler.client.conversations_info.assert_not_called()
+        handler.client.chat_postMessage.assert_not_called()
+        handler._defer_indexing.assert_called_once_with(message)
+
+    def test_deferred_indexing_waits_for_load_to_drop(self, handler, message):
+        """Test that deferred messages are indexed on the backfill lane once the queue drains."""
+        handler.client.conversations_info.return_value = {"channel": {"name": "prototype"}}
+        handler.admission.load = Mock(return_value=0.8)
+        handler._deferred.append((message, None))
+        assert handler.index_deferred() == 0
+
+        other = dict(message, channel="C2", ts="3.000001")
+        handler._deferred.append((other, None))
+        handler.client.conversations_info.side_effect = lambda channel, priority: {
+            "channel": {"name": "prototype" if channel == "C1" else "random"}
+        }
+        handler.admission.load = Mock(return_value=0.1)
+        assert handler.index_deferred() == 1
+        handler.vector_store.add_message.assert_called_once_with(message, "C1", priority=Priority.BACKFILL)
+        assert not handler._deferred
+
+    def test_failed_deferred_indexing_is_retried(self, handler, message):
+        handler.vector_store.add_message.side_effect = [RuntimeError("slack down"), None]
+        handler._deferred.append((message, "C1"))
+        assert handler.index_deferred() == 0
+        assert handler.index_deferred() == 1
+
+class TestMultiCandidateSummaries:
+    @pytest.fixture
+    def vector_store(self):
+        store = Mock()
+        store.channel_name = "prototype"
+        store.find_similar_messages.return_value = [
+            {"text": "VPN access?", "ts": "1.000001", "permalink": "https://slack.com/1", "similarity": 0.92},
+            {"text": "Getting VPN", "ts": "1.000002", "permalink": "https://slack.com/2", "similarity": 0.90},
+            {"text": "VPN setup", "ts": "1.000003", "permalink": "https://slack.com/3", "similarity": 0.81},
+        ]
+        store.get_thread_messages.side_effect = lambda channel, ts, deadline: ["Question " + ts, "Answer " + ts]
+        return store
+
+    @pytest.fixture
+    def handler(self, vector_store):
+        handler = MessageHandler(vector_store)
+        handler.client = Mock()
+        handler.max_summaries = 3
+        handler.summary_similarity_gap = 0.05
+        return handler
+
+    @pytest.fixture
+    def message(self):
+        return {"text": "How can I get VPN access?", "ts": "2.000001", "user": "U1", "channel": "C1"}
+
+    def test_candidates_gated_on_similarity_gap(self, handler, vector_store):
+        """Test that only candidates close to the best match are summarized."""
+        candidates = handler._summary_candidates(vector_store.find_similar_messages.return_value)
+        assert [c["ts"] for c in candidates] == ["1.000001", "1.000002"]
+
+        handler.summary_similarity_gap = 0.5
+        handler.max_summaries = 2
+        candidates = handler._summary_candidates(vector_store.find_similar_messages.return_value)
+        assert len(candidates) == 2
+
+    def test_parallel_summaries(self, handler, message):
+        handler.ollama.summarize_thread = Mock(side_effect=lambda thread, thread_id, timeout: "Summary " + thread_id)
+        handler._process_message(message, "C1")
+        text = handler.client.chat_postMessage.call_args[1]["text"]
+        assert "I found 2 similar questions" in text
+        assert "Summary 1.000001" in text and "Summary 1.000002" in text
+        assert "https://slack.com/3" not in text
+
+    def test_combined_summary(self, handler, message):
+        handler.summary_mode = "combined"
+        handler.ollama.summarize_threads = Mock(return_value=["First", None])
+        handler._process_message(message, "C1")
+        handler.ollama.summarize_threads.assert_called_once()
+        text = handler.client.chat_postMessage.call_args[1]["text"]
+        assert "First" in text
+        assert "That thread has 1 replies." in text
+
+    def test_single_candidate_keeps_single_format(self, handler, message):
+        handler.max_summaries = 1
+        handler.ollama.summarize_thread = Mock(return_value="Only summary")
+        handler._process_message(message, "C1")
+        text = handler.client.chat_postMessage.call_args[1]["text"]
+        assert "Here's a summary of the previous answer" in text
+
+    def test_reposted_question_summarized_once(self, handler, vector_store):
+        vector_store.find_similar_messages.return_value[1]["text"] = "  vpn ACCESS? "
+        candidates = handler._summary_candidates(vector_store.find_similar_messages.return_value)
+        assert [c["ts"] for c in candidates] == ["1.000001"]
+
+    def test_same_thread_summarized_once(self, handler, vector_store, message):
+        vector_store.get_thread_messages.side_effect = lambda channel, ts, deadline: ["VPN access?", "Use the portal"]
+        handler.ollama.summarize_thread = Mock(return_value="Only summary")
+        handler._process_message(message, "C1")
+        handler.ollama.summarize_thread.assert_called_once()
+        assert vector_store.get_thread_messages.call_count == 2
+        text = handler.client.chat_postMessage.call_args[1]["text"]
+        assert "Here's a summary of the previous answer" in text
+        assert "https://slack.com/1" in text and "https://slack.com/2" not in text
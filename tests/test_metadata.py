@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+from deja_q.metadata import AppendableRows, MessageMetadata
+
+class TestMessageMetadata:
+    @pytest.fixture
+    def messages(self):
+        return [
+            {"text": "How do I configure my AWS credentials?", "ts": "1234567890.123456",
+             "user": "U123456", "permalink": "https://slack.com/1"},
+            {"text": "Wie geht's? ✓", "ts": "1234567891.000100",
+             "user": "U123457", "permalink": "https://slack.com/2"},
+            {"text": "Another one from the first user", "ts": "1234567892.999999",
+             "user": "U123456", "permalink": ""},
+            {"text": "No user", "ts": "1234567893.000001", "user": None, "permalink": ""},
+        ]
+
+    def test_round_trip(self, messages):
+        """Test that rows read back as the original message dicts."""
+        metadata = MessageMetadata(messages)
+        assert len(metadata) == len(messages)
+        assert list(metadata) == messages
+        assert metadata[-1] == messages[-1]
+        assert metadata[1:3] == messages[1:3]
+        with pytest.raises(IndexError):
+            metadata[len(messages)]
+
+    def test_users_are_interned(self, messages):
+        metadata = MessageMetadata(messages)
+        assert metadata._user_names == ["U123456", "U123457"]
+        assert list(metadata._user.to_array()) == [0, 1, 0, -1]
+
+    def test_texts_and_latest_ts(self, messages):
+        metadata = MessageMetadata(messages)
+        assert metadata.texts(2) == [messages[2]["text"], messages[3]["text"]]
+        assert metadata.latest_ts() == "1234567893.000001"
+        assert MessageMetadata().latest_ts() is None
+
+    def test_grows_past_initial_capacity(self):
+        metadata = MessageMetadata()
+        for i in range(2500):
+            metadata.append({"text": f"message {i}", "ts": f"{1000 + i}.000001", "user": f"U{i % 3}"})
+        assert len(metadata) == 2500
+        assert metadata[2499] == {"text": "message 2499", "ts": "3499.000001", "permalink": "", "user": "U0"}
+
+    @pytest.mark.parametrize("mmap", [False, True])
+    def test_save_and_load(self, messages, tmp_path, mmap):
+        """Test that saved columns load back, and that loaded columns can still be appended to."""
+        MessageMetadata(messages).save(str(tmp_path))
+        loaded = MessageMetadata.load(str(tmp_path), mmap=mmap)
+        assert list(loaded) == messages
+        if mmap:
+            assert isinstance(loaded._ts.base, np.memmap)
+
+        extra = {"text": "new", "ts": "1234567899.000001", "user": "U999", "permalink": "https://slack.com/9"}
+        loaded.append(extra)
+        assert list(loaded) == messages + [extra]
+        assert loaded.latest_ts() == "1234567899.000001"
+        if mmap:
+            # Appended rows go to an in-memory tail, the mapped columns are not copied
+            assert isinstance(loaded._ts.base, np.memmap)
+            assert isinstance(loaded._text._base_data, np.memmap)
+
+        # Saving over the mapped files keeps the loaded copy readable
+        loaded.save(str(tmp_path))
+        assert list(loaded) == messages + [extra]
+        assert list(MessageMetadata.load(str(tmp_path), mmap=mmap)) == messages + [extra]
+
+    def test_save_first_rows(self, messages, tmp_path):
+        metadata = MessageMetadata(messages[:2])
+        metadata.save(str(tmp_path / "base"))
+        loaded = MessageMetadata.load(str(tmp_path / "base"), mmap=True)
+        loaded.extend(messages[2:])
+        for count in (1, 3, 4):
+            loaded.save(str(tmp_path / str(count)), count)
+            assert list(MessageMetadata.load(str(tmp_path / str(count)))) == messages[:count]
+
+class TestAppendableRows:
+    def test_segments_and_append(self):
+        rows = AppendableRows(np.arange(6, dtype=np.float32).reshape(3, 2))
+        rows.append(np.array([[6, 7], [8, 9]], dtype=np.float32))
+        assert rows.shape == (5, 2)
+        np.testing.assert_array_equal(rows[3], [6, 7])
+        np.testing.assert_array_equal(rows.to_array(), np.arange(10).reshape(5, 2))
+        assert [len(part) for part in rows.segments(2, 4)] == [1, 1]
+        assert [len(part) for part in rows.segments(3)] == [2]
@@ -178,6 +178,54 @@ class TestOllamaClient:
         summary = ollama_client.summarize_thread(test_case["messages"])
         self.log_test_details(f"Various Thread Types - {test_case['name']}", prompt_payload, summary)
 
+    def test_summary_is_cached(self, ollama_client, mock_response):
+        """Test that summarizing the same thread again does not call Ollama."""
+        messages = ["How do I get VPN access?", "File a ticket with IT"]
+
+        with patch('requests.post', return_value=mock_response) as mock_post:
+            first = ollama_client.summarize_thread(messages)
+            second = ollama_client.summarize_thread(messages)
+
+        assert first == second == "Mocked summary response"
+        assert mock_post.call_count == 1
+
+    def test_summarize_threads_combined(self, ollama_client):
+        """Test that cached and empty threads are left out of the request."""
+        threads = [
+            ["How do I get VPN access?", "File a ticket with IT"],
+            ["How do I get VPN?", "Ask your manager"],
+            ["Only a question"],
+        ]
+        ollama_client.summary_cache.put((ollama_client.model, tuple(threads[1])), "Cached summary")
+        response = Mock()
+        response.json.return_value = {"response": "File a ticket with IT"}
+        response.raise_for_status.return_value = None
+
+        with patch('requests.post', return_value=response) as mock_post:
+            summaries = ollama_client.summarize_threads(threads)
+
+        # Only one thread was left, so it is summarized with the single-thread prompt
+        assert summaries == ["File a ticket with IT", "Cached summary", "No answers found in the thread."]
+        assert mock_post.call_count == 1
+        assert "Thread 1:" not in mock_post.call_args[1]['json']['prompt']
+
+    def test_summarize_threads_combined_prompt(self, ollama_client):
+        """Test that several threads are summarized in one request and the answer is split per thread."""
+        threads = [
+            ["How do I get VPN access?", "File a ticket with IT"],
+            ["How do I get VPN?", "Ask your manager"],
+        ]
+        response = Mock()
+        response.json.return_value = {"response": "**Thread 1:** File a ticket\nThread 2: Ask your manager"}
+        response.raise_for_status.return_value = None
+
+        with patch('requests.post', return_value=response) as mock_post:
+            summaries = ollama_client.summarize_threads(threads)
+
+        payload = mock_post.call_args[1]['json']
+        assert "Thread 1:" in payload['prompt'] and "Thread 2:" in payload['prompt']
+        assert summaries == ["File a ticket", "Ask your manager"]
+
 if __name__ == "__main__":
     # For manual testing and debugging
     client = OllamaClient(model="llama3.2")
@@ -0,0 +1,128 @@
+import os
+import threading
+import time
+import pytest
+import deja_q.profiling as profiling
+from deja_q.profiling import ProfileInProgressError, SamplingProfiler, Tracer, profile_session
+
+class TestTracer:
+    def test_records_nested_spans(self):
+        tracer = Tracer(enabled=True)
+        with tracer.trace("handle_message", ts="1.0"):
+            tracer.add_span("queue_wait", 0.5)
+            with tracer.span("search"):
+                with tracer.span("encode_query"):
+                    pass
+            with tracer.span("post"):
+                pass
+
+        trace = tracer.slowest()[0]
+        assert trace.attributes == {"ts": "1.0"}
+        assert [(name, parent) for name, parent, _, _ in trace.spans] == [
+            ("queue_wait", 0), ("search", 0), ("encode_query", 2), ("post", 0)
+        ]
+
+    def test_disabled_records_nothing(self):
+        tracer = Tracer(enabled=False)
+        with tracer.trace("handle_message") as trace:
+            with tracer.span("search"):
+                pass
+        assert trace is None
+        assert tracer.slowest() == []
+
+    def test_span_outside_trace_is_noop(self):
+        tracer = Tracer(enabled=True)
+        with tracer.span("search"):
+            pass
+        assert tracer.slowest() == []
+
+    def test_keeps_only_slowest(self):
+        tracer = Tracer(enabled=True, keep_slowest=2)
+        for delay in [0.0, 0.02, 0.01, 0.0]:
+            with tracer.trace("handle_message", delay=delay):
+                time.sleep(delay)
+        assert [t.attributes["delay"] for t in tracer.slowest()] == [0.02, 0.01]
+
+    def test_writes_collapsed_stacks(self, tmp_path):
+        tracer = Tracer(enabled=True)
+        with tracer.trace("handle_message"):
+            with tracer.span("search"):
+                time.sleep(0.01)
+        path = tmp_path / "traces.collapsed"
+        tracer.write_collapsed(str(path))
+        lines = dict(line.rsplit(" ", 1) for line in path.read_text().splitlines())
+        assert int(lines["handle_message;search"]) >= 10000
+
+    def test_wrapped_spans_join_trace_on_pool_threads(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        tracer = Tracer(enabled=True)
+
+        def fetch(i):
+            with tracer.span("fetch"):
+                return threading.current_thread().name
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            with tracer.trace("handle_message"):
+                with tracer.span("fetch_threads"):
+                    names = list(pool.map(tracer.wrap(fetch), range(4)))
+            # The pool threads are left without a trace afterwards
+            assert set(pool.map(lambda _: tracer._local.__dict__.get("trace"), range(2))) == {None}
+
+        assert all(name != threading.current_thread().name for name in names)
+        spans = tracer.slowest()[0].spans
+        assert [(name, parent) for name, parent, _, _ in spans] == [("fetch_threads", 0)] + [("fetch", 1)] * 4
+
+    def test_flushes_slowest_traces(self, tmp_path):
+        tracer = Tracer(enabled=True)
+        with tracer.trace("handle_message"):
+            with tracer.span("search"):
+                pass
+        tracer.start_flushing(str(tmp_path), interval=0.01)
+        for _ in range(100):
+            if (tmp_path / "traces.collapsed").exists():
+                break
+            time.sleep(0.01)
+        assert (tmp_path / "traces.json").exists()
+        assert "handle_message;search" in (tmp_path / "traces.collapsed").read_text()
+
+class TestSamplingProfiler:
+    def test_samples_other_threads(self, tmp_path):
+        stop = threading.Event()
+
+        def busy_worker():
+            while not stop.is_set():
+                sum(range(1000))
+
+        worker = threading.Thread(target=busy_worker, name="busy")
+        worker.start()
+        profiler = SamplingProfiler(interval=0.001)
+        profiler.start(0.05)
+        profiler.join()
+        stop.set()
+        worker.join()
+
+        path = tmp_path / "profile.collapsed"
+        profiler.write_collapsed(str(path))
+        assert any(line.startswith("busy;") and "busy_worker" in line
+                   for line in path.read_text().splitlines())
+
+class TestProfileSession:
+    def wait_for_session(self):
+        assert profiling._session_lock.acquire(timeout=5)
+        profiling._session_lock.release()
+
+    def test_one_session_at_a_time(self, tmp_path):
+        """Test that an overlapping session is refused and the tracer is restored afterwards."""
+        was_enabled = profiling.tracer.enabled
+        paths = profile_session(0.05, str(tmp_path))
+        with pytest.raises(ProfileInProgressError):
+            profile_session(0.05, str(tmp_path))
+        self.wait_for_session()
+        assert profiling.tracer.enabled == was_enabled
+        assert all(os.path.exists(path) for path in paths.values())
+
+        # Back-to-back sessions don't overwrite each other's files
+        second = profile_session(0.01, str(tmp_path))
+        self.wait_for_session()
+        assert set(second.values()).isdisjoint(paths.values())
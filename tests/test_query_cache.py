@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+from unittest.mock import Mock
+from deja_q.cache import LRUCache
+from deja_q.vector_store import MessageVectorStore
+
+class TestLRUCache:
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_size=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        assert cache.get("a") == 1
+        cache.put("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.stats()["hits"] == 2
+        assert cache.stats()["misses"] == 1
+
+    def test_stale_entry_counts_as_miss(self):
+        cache = LRUCache(max_size=2)
+        cache.put("a", 1)
+        assert cache.get("a", valid=lambda value: value > 1) is None
+        assert len(cache) == 0
+        assert cache.stats()["hits"] == 0
+        assert cache.stats()["misses"] == 1
+
+    def test_disabled(self):
+        cache = LRUCache(max_size=0)
+        cache.put("a", 1)
+        assert cache.get("a") is None
+
+class TestQueryCache:
+    @pytest.fixture
+    def vector_store(self, fake_model):
+        store = MessageVectorStore("test-channel", client=Mock())
+        store.messages = [
+            {"text": "vpn access please", "ts": "1.000001", "user": "U1", "permalink": "https://slack.com/1"},
+            {"text": "deploy to heroku", "ts": "2.000001", "user": "U2", "permalink": "https://slack.com/2"},
+        ]
+        store.create_embeddings()
+        store.model.calls = 0
+        return store
+
+    def test_repeat_question_skips_model_and_scan(self, vector_store):
+        """Test that a repeated (differently spaced and cased) question is answered from the cache."""
+        first = vector_store.find_similar_messages("How   do I get VPN access?", threshold=0.3)
+        second = vector_store.find_similar_messages("how do i get vpn access?", threshold=0.3)
+        assert first == second
+        assert first[0]["ts"] == "1.000001"
+        assert vector_store.model.calls == 1
+        assert vector_store.query_cache_stats()["results"]["hits"] == 1
+
+    def test_new_message_scored_incrementally(self, vector_store, monkeypatch):
+        """Test that after an insert only the new row is scored, reusing the cached query embedding."""
+        query = "vpn access please"
+        assert len(vector_store.find_similar_messages(query, threshold=0.9)) == 1
+        vector_store.add_message({"text": "VPN access please", "ts": "3.000001", "user": "U3"}, "C1")
+        calls = vector_store.model.calls
+
+        scanned = []
+        rank = MessageVectorStore._rank
+        monkeypatch.setattr(MessageVectorStore, "_rank",
+                            staticmethod(lambda embeddings, *args, **kwargs:
+                                         scanned.append(len(embeddings)) or rank(embeddings, *args, **kwargs)))
+        results = vector_store.find_similar_messages(query, threshold=0.9)
+        assert [r["ts"] for r in results] == ["1.000001", "3.000001"]
+        assert scanned == [1]
+        assert vector_store.model.calls == calls
+        stats = vector_store.query_cache_stats()
+        assert stats["embeddings"]["hits"] == 1
+        assert stats["results"]["partial_hits"] == 1
+
+    def test_repeated_question_asked_and_indexed(self, vector_store):
+        """Test the live pattern of searching for a question and then indexing it."""
+        query = "vpn access please"
+        for i in range(3):
+            results = vector_store.find_similar_messages(query, threshold=0.9, limit=2)
+            vector_store.add_message({"text": query, "ts": f"{3 + i}.000001", "user": "U3"}, "C1")
+        assert [r["ts"] for r in results] == ["1.000001", "3.000001"]
+        # One encode for the query, one per indexed message, and no full scan after the first
+        assert vector_store.model.calls == 1 + 3
+        stats = vector_store.query_cache_stats()["results"]
+        assert stats["misses"] == 1
+        assert stats["partial_hits"] == 2
+
+    def test_replacing_embeddings_invalidates_results(self, vector_store):
+        vector_store.find_similar_messages("vpn access please", threshold=0.9)
+        vector_store.create_embeddings()
+        vector_store.find_similar_messages("vpn access please", threshold=0.9)
+        stats = vector_store.query_cache_stats()["results"]
+        assert stats["hits"] == 0
+        assert stats["misses"] == 2
+
+    def test_case_kept_for_cased_models(self, vector_store, fake_model):
+        """Test that queries differing only in case get their own entries if the model is cased."""
+        vector_store.model = fake_model("cased-model", lowercase=False)
+        upper = vector_store.find_similar_messages("VPN access please", threshold=0.3)
+        lower = vector_store.find_similar_messages("vpn access please", threshold=0.3)
+        assert vector_store.model.calls == 2
+        assert vector_store.query_cache_stats()["embeddings"]["hits"] == 0
+        assert upper != lower
+
+    def test_model_sees_original_query(self, vector_store):
+        encoded = []
+        encode = vector_store.model.encode
+        vector_store.model.encode = lambda texts, **kwargs: encoded.extend(texts) or encode(texts, **kwargs)
+        vector_store.find_similar_messages("How do I get  VPN access?", threshold=0.3)
+        assert encoded == ["How do I get  VPN access?"]
+
+    def test_threshold_and_limit_are_part_of_key(self, vector_store):
+        assert len(vector_store.find_similar_messages("vpn deploy", threshold=0.1)) == 2
+        assert len(vector_store.find_similar_messages("vpn deploy", threshold=0.1, limit=1)) == 1
@@ -0,0 +1,184 @@
+import threading
+import numpy as np
+import pytest
+from unittest.mock import Mock
+from deja_q.metadata import MessageMetadata
+from deja_q.reindex import ReindexJob
+from deja_q.vector_store import MessageVectorStore
+
+class TestReindex:
+    @pytest.fixture
+    def messages(self):
+        return [
+            {"text": "apple banana", "ts": "1.000001", "user": "U1", "permalink": "https://slack.com/1"},
+            {"text": "cherry date", "ts": "2.000001", "user": "U2", "permalink": "https://slack.com/2"},
+        ]
+
+    @pytest.fixture
+    def vector_store(self, monkeypatch, fake_model, messages, tmp_path):
+        monkeypatch.setattr(MessageVectorStore, "fetch_channel_history",
+                            lambda self: setattr(self, "messages", list(messages)))
+        monkeypatch.setattr(MessageVectorStore, "_fetch_messages", lambda self, oldest=None: [])
+        store = MessageVectorStore("test-channel", client=Mock(), model_name="small-model",
+                                   index_dir=str(tmp_path))
+        store.initialize()
+        return store
+
+    def test_index_persisted_per_model(self, vector_store, messages):
+        """Test that a saved index is only loaded by a store using the same model."""
+        same = MessageVectorStore("test-channel", client=Mock(), model_name="small-model",
+                                  index_dir=vector_store.index_dir)
+        assert same.load_index()
+        assert len(same.messages) == len(messages)
+        np.testing.assert_array_equal(same.embeddings, vector_store.embeddings)
+
+        other = MessageVectorStore("test-channel", client=Mock(), model_name="large-model",
+                                   index_dir=vector_store.index_dir)
+        assert not other.load_index()
+
+    def test_reindex_swaps_model(self, vector_store, fake_model):
+        """Test that a re-index switches model and embeddings together and persists them."""
+        job = ReindexJob(vector_store, "large-model", cpu_budget=1.0,
+                         model=fake_model("large-model"))
+        job.run()
+        assert job.state == ReindexJob.DONE
+        assert vector_store.model_name == "large-model"
+        assert vector_store.embeddings.shape == (2, 8)
+        assert vector_store.find_similar_messages("apple banana", threshold=0.9)[0]["ts"] == "1.000001"
+
+        reloaded = MessageVectorStore("test-channel", client=Mock(), model_name="large-model",
+                                      index_dir=vector_store.index_dir)
+        assert reloaded.load_index()
+
+    def test_messages_added_during_reindex_are_included(self, vector_store, fake_model):
+        """Test that messages added after the re-index snapshot are encoded at swap time."""
+        vector_store.add_message({"text": "elderberry fig", "ts": "3.000001", "user": "U3"}, "C1")
+        model = fake_model("large-model")
+        embeddings = model.encode(["apple banana", "cherry date"])
+        vector_store.swap_model("large-model", model, embeddings, 2)
+        assert vector_store.embeddings.shape == (3, 8)
+
+    def test_model_swapped_while_adding_message(self, vector_store, fake_model):
+        """Test that a message encoded with the old model is encoded again after a swap."""
+        large = fake_model("large-model")
+        old_encode = vector_store.model.encode
+
+        def encode_then_swap(texts, **kwargs):
+            vector_store.model.encode = old_encode
+            vector_store.swap_model("large-model", large, large.encode(["apple banana", "cherry date"]), 2)
+            return old_encode(texts, **kwargs)
+
+        vector_store.model.encode = encode_then_swap
+        vector_store.add_message({"text": "elderberry fig", "ts": "3.000001", "user": "U3"}, "C1")
+        assert vector_store.embeddings.shape == (3, 8)
+        assert len(vector_store.messages) == 3
+
+    def test_permalink_lookup_does_not_hold_lock(self, vector_store):
+        """Test that searches can take the store lock while a permalink is being fetched."""
+        acquired = []
+
+        def try_lock():
+            acquired.append(vector_store._lock.acquire(timeout=1))
+            if acquired[-1]:
+                vector_store._lock.release()
+
+        def get_permalink(**kwargs):
+            thread = threading.Thread(target=try_lock)
+            thread.start()
+            thread.join()
+            return {"permalink": "https://slack.com/3"}
+
+        vector_store.client.chat_getPermalink.side_effect = get_permalink
+        vector_store.add_message({"text": "elderberry fig", "ts": "3.000001", "user": "U3"}, "C1")
+        assert acquired == [True]
+
+    def test_restart_reuses_saved_index(self, vector_store, fake_model):
+        """Test that a re-index that already finished before a restart is loaded, not re-encoded."""
+        ReindexJob(vector_store, "large-model", cpu_budget=1.0,
+                   model=fake_model("large-model")).run()
+
+        restarted = MessageVectorStore("test-channel", client=Mock(), model_name="small-model",
+                                       index_dir=vector_store.index_dir)
+        restarted.initialize()
+        model = fake_model("large-model")
+        model.encode = Mock(side_effect=AssertionError("corpus encoded again"))
+        job = ReindexJob(restarted, "large-model", cpu_budget=1.0, model=model)
+        job.run()
+        assert job.state == ReindexJob.DONE
+        assert restarted.model is model
+        assert restarted.embeddings.shape == (2, 8)
+
+    def test_swap_encodes_new_messages_outside_lock(self, vector_store, fake_model):
+        """Test that messages added during a re-index are encoded without blocking searches."""
+        vector_store.add_message({"text": "elderberry fig", "ts": "3.000001", "user": "U3"}, "C1")
+        model = fake_model("large-model")
+        embeddings = model.encode(["apple banana", "cherry date"])
+        acquired = []
+        encode = model.encode
+
+        def try_lock():
+            acquired.append(vector_store._lock.acquire(timeout=1))
+            if acquired[-1]:
+                vector_store._lock.release()
+
+        def encode_checking_lock(texts, **kwargs):
+            thread = threading.Thread(target=try_lock)
+            thread.start()
+            thread.join()
+            return encode(texts, **kwargs)
+
+        model.encode = encode_checking_lock
+        vector_store.swap_model("large-model", model, embeddings, 2)
+        assert acquired == [True]
+        assert vector_store.embeddings.shape == (3, 8)
+
+    def test_pause_scales_with_cpu_time(self, vector_store):
+        """Test that the pause is based on CPU time across all cores, not wall time."""
+        job = ReindexJob(vector_store, "large-model", cpu_budget=0.25)
+        job.cpu_count = 4
+        # A batch that kept all 4 cores busy for 1s needs 3s of rest for a 25% budget
+        assert job._pause_for(wall=1.0, cpu=4.0) == pytest.approx(3.0)
+        # A single-threaded batch already stays within budget
+        assert job._pause_for(wall=1.0, cpu=0.9) == 0.0
+
+    def test_mapped_index_stays_mapped(self, vector_store):
+        """Test that new messages don't copy a memory-mapped index into memory."""
+        mapped = MessageVectorStore("test-channel", client=Mock(), model_name="small-model",
+                                    index_dir=vector_store.index_dir)
+        mapped.mmap_index = True
+        assert mapped.load_index()
+        mapped.add_message({"text": "apple banana cherry", "ts": "3.000001", "user": "U3"}, "C1")
+        assert isinstance(mapped._embedding_rows.base, np.memmap)
+        assert mapped.embeddings.shape == (3, 4)
+        results = mapped.find_similar_messages("apple banana cherry", threshold=0.5)
+        assert [r["ts"] for r in results][0] == "3.000001"
+
+        mapped.save_index()
+        reloaded = MessageVectorStore("test-channel", client=Mock(), model_name="small-model",
+                                      index_dir=vector_store.index_dir)
+        assert reloaded.load_index()
+        np.testing.assert_array_equal(reloaded.embeddings, mapped.embeddings)
+
+    def test_save_does_not_hold_lock(self, vector_store, monkeypatch):
+        """Test that searches can take the store lock while the index is written."""
+        acquired = []
+        save = MessageMetadata.save
+
+        def try_lock():
+            acquired.append(vector_store._lock.acquire(timeout=1))
+            if acquired[-1]:
+                vector_store._lock.release()
+
+        def save_checking_lock(self, path, count=None):
+            thread = threading.Thread(target=try_lock)
+            thread.start()
+            thread.join()
+            save(self, path, count)
+
+        monkeypatch.setattr(MessageMetadata, "save", save_checking_lock)
+        vector_store.save_index()
+        assert acquired == [True]
+
+    def test_invalid_cpu_budget(self, vector_store):
+        with pytest.raises(ValueError):
+            ReindexJob(vector_store, "large-model", cpu_budget=0)
@@ -0,0 +1,106 @@
+import json
+import numpy as np
+import pytest
+from deja_q.metadata import MessageMetadata
+from deja_q.replay import (best_earlier_matches, load_export, load_index, main,
+                           normalize_rows, threshold_report)
+
+class TestBestEarlierMatches:
+    @pytest.mark.parametrize("query_block,key_chunk", [(512, 32768), (7, 5), (1, 1)])
+    def test_matches_brute_force(self, query_block, key_chunk):
+        """Test that blocked scoring finds the same best earlier match as a full scan."""
+        rng = np.random.default_rng(0)
+        embeddings = normalize_rows(rng.normal(size=(50, 8)).astype(np.float32))
+        best_similarity, best_index = best_earlier_matches(embeddings, query_block, key_chunk)
+
+        assert best_index[0] == -1
+        assert best_similarity[0] == -np.inf
+        for i in range(1, len(embeddings)):
+            scores = embeddings[:i] @ embeddings[i]
+            assert best_index[i] == int(np.argmax(scores))
+            assert best_similarity[i] == pytest.approx(scores.max(), abs=1e-5)
+
+class TestThresholdReport:
+    def test_hit_rates_and_proxies(self):
+        best_similarity = np.array([-np.inf, 0.9, 0.7, 0.95], dtype=np.float32)
+        best_index = np.array([-1, 0, 1, 0])
+        answered = np.array([True, False, True, False])
+        rows = threshold_report(best_similarity, best_index, answered, [0.8, 0.6])
+
+        assert [row["threshold"] for row in rows] == [0.6, 0.8]
+        assert rows[0]["hits"] == 3
+        assert rows[0]["useful_hits"] == 2
+        assert rows[0]["precision_proxy"] == pytest.approx(2 / 3)
+        assert rows[1]["hit_rate"] == pytest.approx(0.5)
+        assert rows[1]["recall_proxy"] == pytest.approx(1.0)
+
+        # Only one of the two questions with an answered earlier match scores above 0.92
+        rows = threshold_report(best_similarity, best_index, answered, [0.92])
+        assert rows[0]["recall_proxy"] == pytest.approx(0.5)
+
+    def test_without_thread_information(self):
+        rows = threshold_report(np.array([0.9]), np.array([0]), None, [0.8])
+        assert "precision_proxy" not in rows[0]
+
+class TestLoading:
+    def test_load_export(self, tmp_path):
+        """Test that an export is reduced to chronological top-level questions with answered flags."""
+        channel_dir = tmp_path / "prototype"
+        channel_dir.mkdir()
+        (channel_dir / "2024-01-02.json").write_text(json.dumps([
+            {"ts": "300.000001", "text": "Third", "user": "U1"},
+            {"ts": "301.000001", "text": "Reply to first", "user": "U2", "thread_ts": "100.000001"},
+        ]))
+        (channel_dir / "2024-01-01.json").write_text(json.dumps([
+            {"ts": "100.000001", "text": "First", "user": "U1", "thread_ts": "100.000001", "reply_count": 2},
+            {"ts": "100.000002", "text": "Sorry, I couldn't find...", "user": "UBOT", "bot_id": "B1",
+             "thread_ts": "100.000001"},
+            {"ts": "200.000001", "text": "Second", "user": "U2", "thread_ts": "200.000001", "reply_count": 1},
+            {"ts": "200.000002", "text": "Sorry, I couldn't find...", "user": "UBOT", "bot_id": "B1",
+             "thread_ts": "200.000001"},
+            {"ts": "250.000001", "text": "joined", "subtype": "channel_join"},
+            {"ts": "260.000001", "text": "Bot says hi", "bot_id": "B1"},
+        ]))
+        texts, timestamps, answered = load_export(str(tmp_path), "prototype")
+        assert texts == ["First", "Second", "Third"]
+        assert list(timestamps) == [100.000001, 200.000001, 300.000001]
+        # Only the human reply counts, the bot's own replies don't answer a question
+        assert list(answered) == [True, False, False]
+
+    def test_load_export_without_replies(self, tmp_path):
+        """Test that reply_users without bot users is used when the export has no reply messages."""
+        (tmp_path / "2024-01-01.json").write_text(json.dumps([
+            {"ts": "100.000001", "text": "First", "user": "U1", "reply_count": 2,
+             "reply_users": ["UBOT", "U2"]},
+            {"ts": "200.000001", "text": "Second", "user": "U2", "reply_count": 1, "reply_users": ["UBOT"]},
+            {"ts": "300.000001", "text": "Announcement", "user": "UBOT", "bot_id": "B1"},
+        ]))
+        _, _, answered = load_export(str(tmp_path))
+        assert list(answered) == [True, False]
+
+    def test_replay_persisted_index(self, tmp_path, capsys):
+        """Test the CLI end to end on a persisted index, without loading a model."""
+        messages = [
+            {"text": "vpn access", "ts": "2.000001", "user": "U1", "permalink": ""},
+            {"text": "vpn access?", "ts": "3.000001", "user": "U2", "permalink": ""},
+            {"text": "heroku deploy", "ts": "1.000001", "user": "U3", "permalink": ""},
+        ]
+        embeddings = np.array([[1, 0], [0.99, 0.1], [0, 1]], dtype=np.float32)
+        MessageMetadata(messages).save(str(tmp_path / "messages"))
+        np.save(tmp_path / "embeddings.npy", embeddings)
+        (tmp_path / "meta.json").write_text(json.dumps(
+            {"version": 2, "model_name": "fake-model", "count": 3, "dim": 2}
+        ))
+
+        texts, _, loaded, model_name = load_index(str(tmp_path))
+        assert texts == ["heroku deploy", "vpn access", "vpn access?"]
+        assert model_name == "fake-model"
+        np.testing.assert_array_equal(loaded[0], embeddings[2])
+
+        output = tmp_path / "report.json"
+        assert main(["--index", str(tmp_path), "--live-sample", "0", "--thresholds", "0.5,0.9",
+                     "--output", str(output)]) == 0
+        report = json.loads(output.read_text())
+        assert report["questions"] == 3
+        assert [row["hits"] for row in report["thresholds"]] == [1, 1]
+        assert "Questions replayed: 3" in capsys.readouterr().out
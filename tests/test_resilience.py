@@ -0,0 +1,131 @@
+import threading
+import time
+import pytest
+from deja_q.resilience import (AdmissionQueue, CircuitBreaker, CircuitOpenError, Deadline, Priority,
+                               RateLimitTimeout, TokenBucket)
+
+class TestCircuitBreaker:
+    def test_opens_after_threshold(self):
+        """Test that the breaker rejects calls after repeated failures."""
+        breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=60)
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow()
+
+    def test_half_open_probe(self):
+        """Test that a single probe is let through after the reset timeout."""
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.01)
+        breaker.record_failure()
+        time.sleep(0.02)
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert breaker.allow()
+        assert not breaker.allow()  # Only one probe at a time
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=0.01)
+        for _ in range(3):
+            breaker.record_failure()
+        time.sleep(0.02)
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+
+    def test_call_raises_when_open(self):
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=60)
+
+        def failing():
+            raise RuntimeError("boom")
+
+        with pytest.raises(RuntimeError):
+            breaker.call(failing)
+        with pytest.raises(CircuitOpenError):
+            breaker.call(lambda: "ok")
+
+class TestDeadline:
+    def test_remaining_and_expired(self):
+        deadline = Deadline(10)
+        assert 9 < deadline.remaining() <= 10
+        assert not deadline.expired()
+        assert Deadline(1, start=time.monotonic() - 2).expired()
+
+class TestAdmissionQueue:
+    def test_sheds_when_full(self):
+        """Test that items beyond the queue size are shed rather than queued."""
+        release = threading.Event()
+        processed = []
+
+        def worker(item, enqueued_at):
+            release.wait()
+            processed.append(item)
+
+        admission = AdmissionQueue(worker, max_size=2, num_workers=1)
+        assert admission.submit(1)
+        time.sleep(0.05)  # Let the worker pick up the first item
+        assert admission.submit(2)
+        assert admission.submit(3)
+        assert not admission.submit(4)
+        assert admission.shed == 1
+        assert admission.load() == 1.0
+
+        release.set()
+        admission.join()
+        assert processed == [1, 2, 3]
+
+class TestTokenBucket:
+    def test_burst_then_throttle(self):
+        """Test that calls beyond the burst capacity have to wait for a refill."""
+        bucket = TokenBucket(per_minute=600, burst=2)
+        assert bucket.acquire() < 0.01
+        assert bucket.acquire() < 0.01
+        assert bucket.acquire() >= 0.05
+
+    def test_backfill_leaves_reserve_for_live(self):
+        """Test that backfill calls cannot drain the tokens reserved for live calls."""
+        bucket = TokenBucket(per_minute=60, burst=5, backfill_reserve=0.4)
+        for _ in range(3):
+            assert bucket.acquire(Priority.BACKFILL) < 0.01
+        # Backfill would now dip into the reserve, live traffic still gets through
+        assert bucket.acquire(Priority.LIVE) < 0.01
+        assert bucket.acquire(Priority.LIVE) < 0.01
+
+    def test_pause_blocks_callers(self):
+        bucket = TokenBucket(per_minute=6000, burst=10)
+        bucket.pause(0.05)
+        assert bucket.acquire() >= 0.04
+
+    def test_live_preempts_waiting_backfill(self):
+        """Test that a live call arriving after a waiting backfill call gets the next token first."""
+        bucket = TokenBucket(per_minute=600, burst=1, backfill_reserve=0)
+        bucket.acquire()
+        order = []
+
+        def acquire(priority):
+            bucket.acquire(priority)
+            order.append(priority)
+
+        backfill = threading.Thread(target=acquire, args=(Priority.BACKFILL,))
+        backfill.start()
+        time.sleep(0.02)
+        live = threading.Thread(target=acquire, args=(Priority.LIVE,))
+        live.start()
+        backfill.join()
+        live.join()
+        assert order == [Priority.LIVE, Priority.BACKFILL]
+
+    def test_timeout_raises_instead_of_waiting(self):
+        """Test that a call gives up when the next token comes after its timeout."""
+        bucket = TokenBucket(per_minute=6000, burst=10)
+        bucket.pause(60)
+        start = time.monotonic()
+        with pytest.raises(RateLimitTimeout):
+            bucket.acquire(timeout=0.5)
+        assert time.monotonic() - start < 0.1
+
+    def test_timeout_allows_short_waits(self):
+        bucket = TokenBucket(per_minute=6000, burst=10)
+        bucket.pause(0.05)
+        assert bucket.acquire(timeout=1.0) >= 0.04
@@ -0,0 +1,61 @@
+import pytest
+from unittest.mock import Mock
+from slack_sdk.errors import SlackApiError
+from deja_q.resilience import Deadline, Priority, RateLimitTimeout
+from deja_q.slack_client import SlackClient
+
+class TestSlackClient:
+    @pytest.fixture
+    def web_client(self):
+        return Mock()
+
+    @pytest.fixture
+    def slack_client(self, web_client):
+        return SlackClient(client=web_client, max_retries=1)
+
+    def rate_limited_error(self, retry_after="0.01"):
+        response = Mock()
+        response.status_code = 429
+        response.headers = {"Retry-After": retry_after}
+        return SlackApiError("ratelimited", response)
+
+    def test_forwards_calls(self, slack_client, web_client):
+        """Test that API methods are forwarded to the wrapped WebClient."""
+        web_client.chat_postMessage.return_value = {"ok": True}
+        result = slack_client.chat_postMessage(channel="C1", text="hi", priority=Priority.BACKFILL)
+        assert result == {"ok": True}
+        web_client.chat_postMessage.assert_called_once_with(channel="C1", text="hi")
+        assert slack_client.stats()["calls"]["chat_postMessage"] == 1
+
+    def test_retries_after_429(self, slack_client, web_client):
+        """Test that a 429 response is retried after the Retry-After delay."""
+        web_client.conversations_replies.side_effect = [self.rate_limited_error(), {"messages": []}]
+        result = slack_client.conversations_replies(channel="C1", ts="1.0")
+        assert result == {"messages": []}
+        assert web_client.conversations_replies.call_count == 2
+        assert slack_client.stats()["rate_limited"]["conversations_replies"] == 1
+
+    def test_gives_up_after_max_retries(self, slack_client, web_client):
+        web_client.conversations_info.side_effect = self.rate_limited_error()
+        with pytest.raises(SlackApiError):
+            slack_client.conversations_info(channel="C1")
+        assert web_client.conversations_info.call_count == 2
+
+    def test_other_errors_are_not_retried(self, slack_client, web_client):
+        response = Mock()
+        response.status_code = 404
+        web_client.conversations_info.side_effect = SlackApiError("channel_not_found", response)
+        with pytest.raises(SlackApiError):
+            slack_client.conversations_info(channel="C1")
+        assert web_client.conversations_info.call_count == 1
+
+    def test_separate_buckets_per_method(self, slack_client):
+        assert slack_client._bucket("chat_postMessage") is not slack_client._bucket("conversations_info")
+        assert slack_client._bucket("chat_getPermalink").rate > slack_client._bucket("conversations_list").rate
+
+    def test_retry_after_beyond_deadline_gives_up(self, slack_client, web_client):
+        """Test that a long Retry-After fails the call at its deadline instead of blocking."""
+        web_client.conversations_replies.side_effect = self.rate_limited_error(retry_after="60")
+        with pytest.raises(RateLimitTimeout):
+            slack_client.conversations_replies(channel="C1", ts="1.0", deadline=Deadline(1))
+        assert web_client.conversations_replies.call_count == 1